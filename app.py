@@ -2,27 +2,57 @@ from os import environ
 
 from flask import Flask
 
-from livejanus import db, livejanus, livejanus_socketio
+from livejanus import db, livejanus
+from livejanus.db import (
+    archive_job,
+    init_db,
+    record_log_job,
+    storage_profile,
+    write_behind_queue,
+)
+from livejanus.metrics import metrics
 from livejanus.util import is_debug
 
-app = Flask(__name__)
 
-app.register_blueprint(livejanus)
+def create_app(sockets: bool = True) -> Flask:
+    app = Flask(__name__)
 
+    app.register_blueprint(livejanus)
 
-app.config["DEBUG"] = is_debug()
-app.config["TEMPLATES_AUTO_RELOAD"] = is_debug()
-app.config["PREFERRED_URL_SCHEME"] = "https"
-app.config["SECRET_KEY"] = environ.get("SECRET", "secretkey")
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///data/livejanus.db"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["DEBUG"] = is_debug()
+    app.config["TEMPLATES_AUTO_RELOAD"] = is_debug()
+    app.config["PREFERRED_URL_SCHEME"] = "https"
+    app.config["SECRET_KEY"] = environ.get("SECRET", "secretkey")
+    app.config["SQLALCHEMY_DATABASE_URI"] = environ.get(
+        "DATABASE_URI", "sqlite:///data/livejanus.db"
+    )
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-db.init_app(app)
-app.app_context().push()
-db.create_all()
+    db.init_app(app)
+    storage_profile.init_app(app)
+    metrics.init_app(app)
+    write_behind_queue.init_app(app)
+    archive_job.init_app(app)
+    record_log_job.init_app(app)
+    if sockets:
+        from livejanus import sockets as livejanus_sockets
+
+        livejanus_sockets.init_app(app)
+    return app
+
+
+def create_asgi_app():
+    from livejanus.asgi import async_socket_server
+
+    app = create_app(False)
+    async_socket_server.init_app(app)
+    return async_socket_server.asgi_app()
 
-livejanus_socketio.init_app(app)
 
 if __name__ == "__main__":
+    from livejanus.sockets import livejanus_socketio
 
+    app = create_app()
+    with app.app_context():
+        init_db()
     livejanus_socketio.run(app, host="127.0.0.1", port=8000)
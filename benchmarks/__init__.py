@@ -0,0 +1,104 @@
+import socket
+import subprocess
+import sys
+from os import environ
+from os.path import abspath, dirname, join as pjoin
+from time import sleep, time
+
+repository_root = dirname(dirname(abspath(__file__)))
+if repository_root not in sys.path:
+    sys.path.insert(0, repository_root)
+
+
+def configure_environment(directory: str, **overrides) -> dict:
+    environ["DATABASE_URI"] = f"sqlite:///{pjoin(directory, 'livejanus.db')}"
+    environ["SESSION_STORE_PATH"] = pjoin(directory, "sessions.db")
+    environ["UPDATE_RATE_LIMIT"] = "0"
+    environ.update({key: str(value) for key, value in overrides.items()})
+    return dict(environ)
+
+
+def load_app(sockets: bool = True):
+    from app import create_app
+    from livejanus.db import init_db
+
+    app = create_app(sockets=sockets)
+    app.app_context().push()
+    init_db()
+    return app
+
+
+def seed_events(event_count: int, counter_count: int, premium: bool) -> list:
+    from livejanus.db import Event, EventUser, User, db
+
+    owner = User(f"owner{time()}", "password", f"{time()}@example.com")
+    db.session.add(owner)
+    db.session.commit()
+    events = []
+    for event_index in range(event_count):
+        event = Event(owner.id, f"Event {event_index}", premium=premium)
+        db.session.add(event)
+        db.session.commit()
+        usernames = [
+            f"counter{counter_index}" for counter_index in range(counter_count)
+        ]
+        for username in usernames:
+            db.session.add(EventUser(event.id, username, "password"))
+        db.session.commit()
+        tokens = [
+            EventUser.authenticate(username, "password", event.id)
+            for username in usernames
+        ]
+        events.append((event.key, tokens))
+    return events
+
+
+def wait_for_port(port: int, timeout: float = 30):
+    deadline = time() + timeout
+    while time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            sleep(0.1)
+    raise TimeoutError(f"Nothing is listening on port {port}")
+
+
+def start_server(port: int, environment: dict) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [
+            "gunicorn",
+            "--worker-class",
+            "eventlet",
+            "--workers",
+            "1",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "app:create_app()",
+        ],
+        cwd=repository_root,
+        env=environment,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(port)
+    return process
+
+
+def stop_processes(processes: list):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def percentile(values: list, fraction: float) -> float:
+    if len(values) == 0:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
@@ -0,0 +1,152 @@
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from threading import Event as ThreadEvent
+from time import sleep, time
+
+import socketio
+
+from benchmarks import (
+    configure_environment,
+    free_port,
+    load_app,
+    repository_root,
+    seed_events,
+    start_server,
+    stop_processes,
+    wait_for_port,
+)
+
+
+class CounterClient:
+    def __init__(self, url: str, token: str, expected_updates: int):
+        self.totals = []
+        self.rejected = 0
+        self._client_id = token[:16]
+        self._sequence = 0
+        self.joined = ThreadEvent()
+        self.converged = ThreadEvent()
+        self._expected_updates = expected_updates
+        self._client = socketio.Client()
+        self._client.on("join", self._on_join)
+        self._client.on("update", self._on_update)
+        self._client.connect(url)
+        self._client.emit("join", token)
+
+    def _on_join(self, data):
+        if data is not False:
+            self.joined.set()
+
+    def _on_update(self, data):
+        if data is False:
+            return
+        self.totals.append(data[2])
+        if len(self.totals) >= self._expected_updates:
+            self.converged.set()
+
+    def update(self, value: int, timeout: float):
+        self._sequence += 1
+        try:
+            ack = self._client.call(
+                "update",
+                {"client": self._client_id, "seq": self._sequence, "count": value},
+                timeout=timeout,
+            )
+        except Exception:
+            ack = False
+        if ack is False or "retry" in ack:
+            self.rejected += 1
+
+    def close(self):
+        self._client.disconnect()
+
+
+def main():
+    parser = ArgumentParser(
+        description="Checks that updates fan out to every server process."
+    )
+    parser.add_argument("--servers", type=int, default=3)
+    parser.add_argument("--counters-per-server", type=int, default=2)
+    parser.add_argument("--updates", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30)
+    arguments = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        broker_port = free_port()
+        environment = configure_environment(
+            directory,
+            SESSION_STORE="sqlite",
+            SOCKETIO_MESSAGE_QUEUE=f"loopback://127.0.0.1:{broker_port}",
+            FLASK_APP="app:create_app(False)",
+        )
+        load_app()
+        counter_count = arguments.servers * arguments.counters_per_server
+        ((event_key, tokens),) = seed_events(1, counter_count, premium=True)
+
+        processes = [
+            subprocess.Popen(
+                [
+                    "flask",
+                    "livejanus",
+                    "fanout-broker",
+                    "--port",
+                    str(broker_port),
+                ],
+                cwd=repository_root,
+                env=environment,
+                stdout=subprocess.DEVNULL,
+            )
+        ]
+        clients = []
+        converged = False
+        try:
+            wait_for_port(broker_port)
+            server_ports = [free_port() for _ in range(arguments.servers)]
+            for port in server_ports:
+                processes.append(start_server(port, environment))
+
+            expected_updates = counter_count * arguments.updates
+            for index, token in enumerate(tokens):
+                port = server_ports[index % len(server_ports)]
+                clients.append(
+                    CounterClient(f"http://127.0.0.1:{port}", token, expected_updates)
+                )
+            for client in clients:
+                client.joined.wait(arguments.timeout)
+
+            start_time = time()
+            for _ in range(arguments.updates):
+                for client in clients:
+                    client.update(1, arguments.timeout)
+                sleep(0.01)
+            deadline = start_time + arguments.timeout
+            for client in clients:
+                client.converged.wait(max(0, deadline - time()))
+            converged = all(
+                client.converged.is_set() and max(client.totals) == expected_updates
+                for client in clients
+            )
+            result = {
+                "servers": arguments.servers,
+                "clients": len(clients),
+                "expected_updates": expected_updates,
+                "received_updates": [len(client.totals) for client in clients],
+                "rejected_updates": sum(client.rejected for client in clients),
+                "final_totals": [
+                    max(client.totals) if client.totals else None for client in clients
+                ],
+                "converged": converged,
+                "seconds": time() - start_time,
+            }
+            print(json.dumps(result, indent=2))
+        finally:
+            for client in clients:
+                client.close()
+            stop_processes(processes)
+    sys.exit(0 if converged else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+
+from benchmarks import configure_environment, repository_root
+
+STARTUP_PATHS = {
+    "cli": "from app import create_app; create_app(False)",
+    "server": "from app import create_app; create_app()",
+}
+HEAVY_MODULES = ["stripe", "argon2", "flask_socketio", "eventlet"]
+
+
+def profile_imports(statement: str) -> dict:
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=repository_root,
+        check=True,
+        stderr=subprocess.PIPE,
+    ).stderr.decode()
+    imported = set()
+    top_level = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative_us, name = line.split("|")
+        if not cumulative_us.strip().isdigit():
+            continue
+        imported.add(name.strip())
+        if not name[1:].startswith(" "):
+            top_level[name.strip()] = int(cumulative_us)
+    return {
+        "total_ms": sum(top_level.values()) / 1000,
+        "heavy_modules": [name for name in HEAVY_MODULES if name in imported],
+        "slowest": [
+            [name, us / 1000]
+            for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:5]
+        ],
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description="Profiles the imports of the CLI and server startup paths."
+    )
+    parser.add_argument("--paths", nargs="+", default=list(STARTUP_PATHS))
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument(
+        "--budget-ms", type=float, help="fail if the CLI path imports for longer"
+    )
+    arguments = parser.parse_args()
+
+    results = []
+    with TemporaryDirectory() as directory:
+        configure_environment(directory)
+        for path in arguments.paths:
+            runs = [
+                profile_imports(STARTUP_PATHS[path])
+                for _ in range(arguments.repetitions)
+            ]
+            result = min(runs, key=lambda run: run["total_ms"])
+            result["path"] = path
+            results.append(result)
+    print(json.dumps(results, indent=2))
+
+    for result in results:
+        if result["path"] != "cli" or arguments.budget_ms is None:
+            continue
+        if result["total_ms"] > arguments.budget_ms or result["heavy_modules"]:
+            sys.exit(
+                f"CLI startup imports took {result['total_ms']:.1f} ms "
+                f"(budget {arguments.budget_ms} ms), "
+                f"heavy modules: {result['heavy_modules']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import json
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from threading import Event as ThreadEvent, Thread
+from time import perf_counter
+
+import requests
+import socketio
+
+from benchmarks import (
+    configure_environment,
+    free_port,
+    load_app,
+    percentile,
+    seed_events,
+    start_server,
+    stop_processes,
+)
+
+
+class LatencyClient:
+    def __init__(self, url: str, token: str):
+        self._received = ThreadEvent()
+        self._accepted = False
+        self.rejected = 0
+        self._client = socketio.Client()
+        self._client.on("update", self._receive)
+        self._client.on("join", lambda data: self._received.set())
+        self._client.connect(url)
+        self._client.emit("join", token)
+        self._received.wait(10)
+
+    def measure(self, updates: int) -> list:
+        latencies = []
+        for index in range(updates):
+            self._received.clear()
+            start_time = perf_counter()
+            self._client.emit("update", 1 if index % 2 == 0 else -1)
+            if self._received.wait(10) and self._accepted:
+                latencies.append(perf_counter() - start_time)
+            else:
+                self.rejected += 1
+        return latencies
+
+    def _receive(self, data):
+        self._accepted = data is not False
+        self._received.set()
+
+    def close(self):
+        self._client.disconnect()
+
+
+def summarise(latencies: list, rejected: int) -> dict:
+    return {
+        "updates": len(latencies),
+        "rejected": rejected,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run_logins(url: str, event_key: str, stop: ThreadEvent, completed: list):
+    session = requests.Session()
+    while not stop.is_set():
+        session.post(
+            f"{url}/event/login/",
+            data={"key": event_key, "username": "counter1", "password": "password"},
+            allow_redirects=False,
+        )
+        completed.append(1)
+
+
+def measure_configuration(environment: dict, event_key: str, token: str, arguments):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = start_server(port, environment)
+    try:
+        client = LatencyClient(url, token)
+        idle_latencies = client.measure(arguments.updates)
+        idle_rejected, client.rejected = client.rejected, 0
+
+        stop = ThreadEvent()
+        completed = []
+        login_threads = [
+            Thread(target=run_logins, args=(url, event_key, stop, completed))
+            for _ in range(arguments.login_threads)
+        ]
+        login_start_time = perf_counter()
+        for thread in login_threads:
+            thread.start()
+        login_latencies = client.measure(arguments.updates)
+        stop.set()
+        login_seconds = perf_counter() - login_start_time
+        for thread in login_threads:
+            thread.join()
+        client.close()
+    finally:
+        stop_processes([server])
+    return {
+        "hash_pool_size": int(environment["HASH_POOL_SIZE"]),
+        "idle": summarise(idle_latencies, idle_rejected),
+        "during_logins": summarise(login_latencies, client.rejected),
+        "logins_completed": len(completed),
+        "logins_per_second": len(completed) / login_seconds,
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description="Measures socket update latency while logins are hashed."
+    )
+    parser.add_argument("--updates", type=int, default=100)
+    parser.add_argument("--login-threads", type=int, default=4)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[0, 4])
+    arguments = parser.parse_args()
+
+    results = []
+    with TemporaryDirectory() as directory:
+        environment = configure_environment(directory, SESSION_STORE="sqlite")
+        load_app()
+        ((event_key, tokens),) = seed_events(1, 2, premium=False)
+        for pool_size in arguments.pool_sizes:
+            environment["HASH_POOL_SIZE"] = str(pool_size)
+            results.append(
+                measure_configuration(environment, event_key, tokens[0], arguments)
+            )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
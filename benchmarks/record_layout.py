@@ -0,0 +1,120 @@
+import json
+import sqlite3
+from argparse import ArgumentParser
+from os.path import getsize, join as pjoin
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import create_engine, text
+
+from benchmarks import percentile
+
+LEGACY_RECORD_TABLE = (
+    "CREATE TABLE record ("
+    "user INTEGER NOT NULL, event INTEGER NOT NULL, "
+    "time FLOAT NOT NULL, value SMALLINT NOT NULL, "
+    "PRIMARY KEY (user, time))"
+)
+LEGACY_EVENT_INDEX = "CREATE INDEX _event ON record (event)"
+
+
+def generate_rows(arguments):
+    generator = Random(0)
+    start_time = 1_600_000_000
+    step = arguments.span / arguments.rows
+    for index in range(arguments.rows):
+        event_id = generator.randrange(arguments.events)
+        user_id = event_id * arguments.users + generator.randrange(arguments.users)
+        value = 1 if generator.random() < 0.7 else -1
+        yield user_id, event_id, start_time + index * step, value
+
+
+def time_queries(path: str, arguments, scale: int) -> dict:
+    connection = sqlite3.connect(path)
+    start_time = 1_600_000_000
+    window_start = start_time + arguments.span * 0.25
+    window_end = start_time + arguments.span * 0.75
+    range_start = start_time + arguments.span * 0.5
+    range_end = range_start + arguments.span * 0.01
+    sum_latencies = []
+    range_latencies = []
+    for repetition in range(arguments.repetitions):
+        event_id = repetition % arguments.events
+        query_start = perf_counter()
+        connection.execute(
+            "SELECT SUM(value) FROM record "
+            "WHERE event = ? AND time >= ? AND time <= ?",
+            (event_id, int(window_start * scale), int(window_end * scale)),
+        ).fetchone()
+        sum_latencies.append(perf_counter() - query_start)
+        query_start = perf_counter()
+        connection.execute(
+            "SELECT time, user, value FROM record "
+            "WHERE event = ? AND time >= ? AND time <= ? ORDER BY time",
+            (event_id, int(range_start * scale), int(range_end * scale)),
+        ).fetchall()
+        range_latencies.append(perf_counter() - query_start)
+    connection.close()
+    return {
+        "bytes": getsize(path),
+        "window_sum_p50_ms": percentile(sum_latencies, 0.5) * 1000,
+        "window_sum_p99_ms": percentile(sum_latencies, 0.99) * 1000,
+        "range_p50_ms": percentile(range_latencies, 0.5) * 1000,
+        "range_p99_ms": percentile(range_latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description="Compares the legacy and compact Record table layouts."
+    )
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--span", type=float, default=24 * 60 * 60)
+    parser.add_argument("--repetitions", type=int, default=50)
+    arguments = parser.parse_args()
+
+    from livejanus.db import Record
+
+    with TemporaryDirectory() as directory:
+        path = pjoin(directory, "records.db")
+        connection = sqlite3.connect(path)
+        connection.execute(LEGACY_RECORD_TABLE)
+        connection.execute(LEGACY_EVENT_INDEX)
+        connection.executemany(
+            "INSERT INTO record (user, event, time, value) VALUES (?, ?, ?, ?)",
+            generate_rows(arguments),
+        )
+        connection.commit()
+        connection.execute("VACUUM")
+        connection.close()
+        legacy = time_queries(path, arguments, 1)
+
+        engine = create_engine(f"sqlite:///{path}")
+        migration_start = perf_counter()
+        with engine.begin() as engine_connection:
+            Record.migrate_layout(engine_connection)
+        with engine.connect() as engine_connection:
+            engine_connection.execute(text("VACUUM"))
+        migration_seconds = perf_counter() - migration_start
+        engine.dispose()
+        compact = time_queries(path, arguments, 1_000_000)
+
+    print(
+        json.dumps(
+            {
+                "rows": arguments.rows,
+                "events": arguments.events,
+                "legacy": legacy,
+                "compact": compact,
+                "migration_seconds": migration_seconds,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
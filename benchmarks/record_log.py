@@ -0,0 +1,97 @@
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+from os.path import join as pjoin
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from benchmarks import (
+    configure_environment,
+    load_app,
+    percentile,
+    repository_root,
+    seed_events,
+)
+
+
+def measure(arguments) -> dict:
+    with TemporaryDirectory() as directory:
+        configure_environment(
+            directory,
+            RECORD_STORAGE=arguments.storage,
+            RECORD_LOG_PATH=pjoin(directory, "records"),
+        )
+        load_app(sockets=False)
+        ((event_key, _),) = seed_events(1, 1, premium=True)
+        from livejanus.db import Event, EventUser, db, record_log_job
+
+        event = Event.from_key(event_key)
+        user_id = EventUser.query.filter(EventUser.event == event.id).first().id
+        write_latencies = []
+        start_time = perf_counter()
+        for _ in range(arguments.records):
+            record_start = perf_counter()
+            event.add_record(user_id, 1)
+            write_latencies.append(perf_counter() - record_start)
+        write_seconds = perf_counter() - start_time
+        db.session.remove()
+
+        compact_start = perf_counter()
+        record_log_job.compact()
+        compact_seconds = perf_counter() - compact_start
+        event = Event.query.filter(Event.key == event_key).first()
+        for _ in range(arguments.records):
+            event.add_record(user_id, 1)
+        db.session.remove()
+
+        total_latencies = []
+        for _ in range(arguments.repetitions):
+            event = Event.query.filter(Event.key == event_key).first()
+            total_start = perf_counter()
+            event.query_total_value()
+            total_latencies.append(perf_counter() - total_start)
+            db.session.remove()
+    return {
+        "storage": arguments.storage,
+        "records": arguments.records,
+        "writes_per_second": arguments.records / write_seconds,
+        "write_p99_ms": percentile(write_latencies, 0.99) * 1000,
+        "compact_seconds": compact_seconds,
+        "total_p50_ms": percentile(total_latencies, 0.5) * 1000,
+        "total_p99_ms": percentile(total_latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description="Compares premium record writes and totals in the table and log."
+    )
+    parser.add_argument("--storages", nargs="+", default=["table", "log"])
+    parser.add_argument("--storage", help="measure one storage mode in this process")
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--repetitions", type=int, default=50)
+    arguments = parser.parse_args()
+
+    if arguments.storage is not None:
+        print(json.dumps(measure(arguments)))
+        return
+
+    results = []
+    for storage in arguments.storages:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.record_log", "--storage", storage]
+            + [
+                f"--{name}={getattr(arguments, name)}"
+                for name in ["records", "repetitions"]
+            ],
+            cwd=repository_root,
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
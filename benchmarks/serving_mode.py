@@ -0,0 +1,175 @@
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from threading import Event as ThreadEvent
+from time import perf_counter
+
+import socketio
+
+from benchmarks import (
+    configure_environment,
+    free_port,
+    load_app,
+    percentile,
+    repository_root,
+    seed_events,
+    start_server,
+    stop_processes,
+    wait_for_port,
+)
+
+
+def start_asgi_server(port: int, environment: dict) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [
+            "uvicorn",
+            "--factory",
+            "--no-access-log",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "app:create_asgi_app",
+        ],
+        cwd=repository_root,
+        env=environment,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(port)
+    return process
+
+
+servers = {"eventlet": start_server, "asyncio": start_asgi_server}
+
+
+def join_counter(url: str, token: str, timeout: float):
+    start_time = perf_counter()
+    client = socketio.Client()
+    joined = ThreadEvent()
+    client.on("join", lambda data: data is not False and joined.set())
+    try:
+        client.connect(url)
+        client.emit("join", {"token": token, "seq": None})
+    except Exception:
+        return None, None
+    if not joined.wait(timeout):
+        client.disconnect()
+        return None, None
+    return client, perf_counter() - start_time
+
+
+def tap_counter(client: socketio.Client, client_id: str, taps: int, timeout: float):
+    latencies = []
+    for sequence in range(1, taps + 1):
+        start_time = perf_counter()
+        try:
+            ack = client.call(
+                "update",
+                {"client": client_id, "seq": sequence, "count": 1},
+                timeout=timeout,
+            )
+        except Exception:
+            ack = False
+        if ack is not False and "retry" not in ack:
+            latencies.append(perf_counter() - start_time)
+    return latencies
+
+
+def measure(arguments) -> dict:
+    mode = arguments.mode
+    with TemporaryDirectory() as directory:
+        environment = configure_environment(
+            directory,
+            SESSION_STORE="sqlite",
+            FLASK_APP="app:create_app(False)",
+        )
+        load_app(sockets=False)
+        tokens = [
+            token
+            for _, event_tokens in seed_events(arguments.clients, 1, premium=True)
+            for token in event_tokens
+        ]
+        port = free_port()
+        processes = [servers[mode](port, environment)]
+        url = f"http://127.0.0.1:{port}"
+        clients = []
+        try:
+            with ThreadPoolExecutor(arguments.clients) as executor:
+                joins = list(
+                    executor.map(
+                        lambda token: join_counter(url, token, arguments.timeout),
+                        tokens,
+                    )
+                )
+                clients = [client for client, _ in joins if client is not None]
+                join_times = [seconds for _, seconds in joins if seconds is not None]
+                start_time = perf_counter()
+                latencies = [
+                    latency
+                    for client_latencies in executor.map(
+                        lambda indexed: tap_counter(
+                            indexed[1],
+                            f"bench{indexed[0]}",
+                            arguments.taps,
+                            arguments.timeout,
+                        ),
+                        enumerate(clients),
+                    )
+                    for latency in client_latencies
+                ]
+                seconds = perf_counter() - start_time
+        finally:
+            for client in clients:
+                client.disconnect()
+            stop_processes(processes)
+    return {
+        "mode": mode,
+        "clients": arguments.clients,
+        "joined": len(clients),
+        "join_p50_ms": percentile(join_times, 0.5) * 1000,
+        "join_p99_ms": percentile(join_times, 0.99) * 1000,
+        "taps": len(clients) * arguments.taps,
+        "acknowledged": len(latencies),
+        "taps_per_second": len(latencies) / seconds if seconds > 0 else 0,
+        "update_p50_ms": percentile(latencies, 0.5) * 1000,
+        "update_p95_ms": percentile(latencies, 0.95) * 1000,
+        "update_p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description="Compares socket capacity and update latency of the serving modes."
+    )
+    parser.add_argument("--modes", nargs="+", default=list(servers))
+    parser.add_argument("--mode", help="measure one serving mode from this process")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--taps", type=int, default=20, help="updates per client")
+    parser.add_argument("--timeout", type=float, default=10)
+    arguments = parser.parse_args()
+
+    if arguments.mode is not None:
+        print(json.dumps(measure(arguments)))
+        return
+
+    results = []
+    for mode in arguments.modes:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.serving_mode", "--mode", mode]
+            + [
+                f"--{name}={getattr(arguments, name)}"
+                for name in ["clients", "taps", "timeout"]
+            ],
+            cwd=repository_root,
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
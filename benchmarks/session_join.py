@@ -0,0 +1,55 @@
+import json
+from argparse import ArgumentParser
+from os import environ
+from os.path import join as pjoin
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from benchmarks import percentile
+
+
+def measure_joins(backend: str, directory: str, live_sessions: int, joins: int):
+    environ["SESSION_STORE"] = backend
+    environ["SESSION_STORE_PATH"] = pjoin(directory, f"{backend}{live_sessions}.db")
+    environ["SOCKET_SESSION_MAX"] = str(live_sessions + joins)
+    from livejanus.auth import SocketSessionHandler
+
+    handler = SocketSessionHandler()
+    for index in range(live_sessions):
+        handler.save(f"live{index}", f"counter{index}", index, "eventkey", 1)
+
+    latencies = []
+    for index in range(joins):
+        start_time = perf_counter()
+        handler.save(f"join{index}", f"counter{index}", index, "eventkey", 1)
+        handler.fetch(f"join{index}")
+        latencies.append(perf_counter() - start_time)
+    return {
+        "backend": backend,
+        "live_sessions": live_sessions,
+        "joins": joins,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description="Measures socket session save and fetch latency at join."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--joins", type=int, default=1000)
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite"])
+    arguments = parser.parse_args()
+
+    results = []
+    with TemporaryDirectory() as directory:
+        for backend in arguments.backends:
+            for size in arguments.sizes:
+                results.append(measure_joins(backend, directory, size, arguments.joins))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import json
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+
+from sqlalchemy import event as sqlalchemy_event
+from sqlalchemy.orm import Session
+
+from benchmarks import configure_environment, load_app, percentile, seed_events
+
+
+class CommitTimer:
+    def __init__(self):
+        self.durations = []
+        self._start_time = None
+        sqlalchemy_event.listen(Session, "before_commit", self._before_commit)
+        sqlalchemy_event.listen(Session, "after_commit", self._after_commit)
+
+    def _before_commit(self, session):
+        self._start_time = perf_counter()
+
+    def _after_commit(self, session):
+        if self._start_time is not None:
+            self.durations.append(perf_counter() - self._start_time)
+            self._start_time = None
+
+    def reset(self):
+        self.durations = []
+
+
+def join_counters(app, socketio, events: list) -> list:
+    counters = []
+    for event_index, (_, tokens) in enumerate(events):
+        for counter_index, token in enumerate(tokens):
+            client = socketio.test_client(app)
+            client.emit("join", token)
+            if client.get_received()[-1]["args"][0] is False:
+                raise RuntimeError("A counter failed to join")
+            counters.append((client, f"load{event_index}.{counter_index}"))
+    return counters
+
+
+def run_load(counters: list, rate: float, duration: float) -> dict:
+    interval = 1 / (rate * len(counters))
+    tap_count = int(duration * rate) * len(counters)
+    latencies = []
+    rejected = 0
+    limited = 0
+    start_time = perf_counter()
+    for index in range(tap_count):
+        client, client_id = counters[index % len(counters)]
+        scheduled_time = start_time + index * interval
+        delay = scheduled_time - perf_counter()
+        if delay > 0:
+            sleep(delay)
+        ack = client.emit(
+            "update",
+            {"client": client_id, "seq": index + 1, "count": 1},
+            callback=True,
+        )
+        latency = perf_counter() - scheduled_time
+        if ack is False:
+            rejected += 1
+        elif "retry" in ack:
+            limited += 1
+        else:
+            latencies.append(latency)
+        if index % len(counters) == len(counters) - 1:
+            for other_client, _ in counters:
+                other_client.get_received()
+    seconds = perf_counter() - start_time
+    return {
+        "taps": tap_count,
+        "rejected": rejected,
+        "limited": limited,
+        "seconds": seconds,
+        "target_per_second": rate * len(counters),
+        "taps_per_second": tap_count / seconds,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description="Simulates counters tapping through join and update in-process."
+    )
+    parser.add_argument("--events", type=int, default=4)
+    parser.add_argument("--counters", type=int, default=5)
+    parser.add_argument("--rate", type=float, default=2, help="taps per counter/s")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--kinds", nargs="+", default=["basic", "premium"])
+    arguments = parser.parse_args()
+
+    results = []
+    with TemporaryDirectory() as directory:
+        configure_environment(directory, SESSION_STORE="memory")
+        app = load_app()
+        from livejanus.db import write_behind_queue
+        from livejanus.sockets import livejanus_socketio
+
+        commit_timer = CommitTimer()
+        for kind in arguments.kinds:
+            events = seed_events(
+                arguments.events, arguments.counters, premium=kind == "premium"
+            )
+            counters = join_counters(app, livejanus_socketio, events)
+            commit_timer.reset()
+            result = run_load(counters, arguments.rate, arguments.duration)
+            write_behind_queue.flush()
+            for client, _ in counters:
+                client.disconnect()
+            result.update(
+                {
+                    "kind": kind,
+                    "events": arguments.events,
+                    "counters_per_event": arguments.counters,
+                    "commits": len(commit_timer.durations),
+                    "commit_p50_ms": percentile(commit_timer.durations, 0.5) * 1000,
+                    "commit_p99_ms": percentile(commit_timer.durations, 0.99) * 1000,
+                    "commit_seconds": sum(commit_timer.durations),
+                }
+            )
+            results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
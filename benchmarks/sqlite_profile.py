@@ -0,0 +1,119 @@
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+from threading import Event as ThreadEvent, Thread
+from time import perf_counter
+
+from benchmarks import (
+    configure_environment,
+    load_app,
+    percentile,
+    repository_root,
+    seed_events,
+)
+
+
+def run_writer(app, event_key: str, stop: ThreadEvent, latencies: list):
+    from livejanus.db import Event, EventUser, db
+
+    with app.app_context():
+        event = Event.from_key(event_key)
+        event_id = event.id
+        user_id = EventUser.query.filter(EventUser.event == event_id).first().id
+        while not stop.is_set():
+            start_time = perf_counter()
+            Event.query.filter(Event.id == event_id).first().add_record(user_id, 1)
+            latencies.append(perf_counter() - start_time)
+        db.session.remove()
+
+
+def run_reader(app, event_key: str, stop: ThreadEvent, latencies: list):
+    from livejanus.db import Event, db
+
+    with app.app_context():
+        while not stop.is_set():
+            start_time = perf_counter()
+            event = Event.query.filter(Event.key == event_key).first()
+            event.query_total_value()
+            for _ in event.iter_csv():
+                pass
+            db.session.remove()
+            latencies.append(perf_counter() - start_time)
+
+
+def measure(arguments) -> dict:
+    with TemporaryDirectory() as directory:
+        configure_environment(directory, SQLITE_PROFILE=arguments.profile)
+        app = load_app()
+        ((event_key, _),) = seed_events(1, 1, premium=True)
+        from livejanus.db import Event, EventUser, db
+
+        event = Event.from_key(event_key)
+        user_id = EventUser.query.filter(EventUser.event == event.id).first().id
+        for _ in range(arguments.records):
+            event.add_record(user_id, 1)
+        db.session.remove()
+
+        stop = ThreadEvent()
+        write_latencies = []
+        read_latencies = []
+        threads = [
+            Thread(target=run_writer, args=(app, event_key, stop, write_latencies))
+            for _ in range(arguments.writers)
+        ] + [
+            Thread(target=run_reader, args=(app, event_key, stop, read_latencies))
+            for _ in range(arguments.readers)
+        ]
+        for thread in threads:
+            thread.start()
+        stop.wait(arguments.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return {
+        "profile": arguments.profile,
+        "writers": arguments.writers,
+        "readers": arguments.readers,
+        "writes_per_second": len(write_latencies) / arguments.duration,
+        "write_p99_ms": percentile(write_latencies, 0.99) * 1000,
+        "reads_per_second": len(read_latencies) / arguments.duration,
+        "read_p99_ms": percentile(read_latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description="Compares read-while-writing throughput of SQLite profiles."
+    )
+    parser.add_argument("--profiles", nargs="+", default=["memory", "wal"])
+    parser.add_argument("--profile", help="measure one profile in this process")
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10)
+    arguments = parser.parse_args()
+
+    if arguments.profile is not None:
+        print(json.dumps(measure(arguments)))
+        return
+
+    results = []
+    for profile in arguments.profiles:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.sqlite_profile", "--profile", profile]
+            + [
+                f"--{name}={getattr(arguments, name)}"
+                for name in ["records", "writers", "readers", "duration"]
+            ],
+            cwd=repository_root,
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import json
+from argparse import ArgumentParser
+from random import Random
+from struct import Struct
+from time import perf_counter
+
+from socketio.packet import EVENT, Packet
+
+from benchmarks import percentile
+
+binary_entry = Struct("<qHihI")
+
+
+def generate_entries(arguments) -> list:
+    from livejanus.live import LiveFeed
+
+    generator = Random(0)
+    usernames = [f"door-{index}" for index in range(arguments.users)]
+    feed = LiveFeed(arguments.updates)
+    record_time = 1_600_000_000 + generator.random() * 1000
+    total = 0
+    for _ in range(arguments.updates):
+        record_time += generator.expovariate(2)
+        count = 1 if generator.random() < 0.7 else -1
+        total += count
+        feed.append([record_time, generator.choice(usernames), total, count])
+    return usernames, list(feed.entries)
+
+
+def encode_binary(entries: list) -> bytes:
+    return b"".join(binary_entry.pack(*entry) for entry in entries)
+
+
+def frame_size(name: str, payload) -> int:
+    encoded = Packet(EVENT, data=[name, payload], namespace="/").encode()
+    if isinstance(encoded, str):
+        return len(encoded.encode()) + 1
+    return sum(len(part) + 1 for part in encoded)
+
+
+def measure(encoders: dict, name: str, batches: list) -> dict:
+    sizes = []
+    durations = []
+    for batch in batches:
+        start_time = perf_counter()
+        payload = encoders[name](batch)
+        size = frame_size("update" if len(batch) == 1 else "updates", payload)
+        durations.append((perf_counter() - start_time) / len(batch))
+        sizes.append(size / len(batch))
+    return {
+        "bytes_per_update": sum(sizes) / len(sizes),
+        "encode_p50_us": percentile(durations, 0.5) * 1_000_000,
+        "encode_p99_us": percentile(durations, 0.99) * 1_000_000,
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        description="Compares the size and encoding cost of update wire formats."
+    )
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=10)
+    arguments = parser.parse_args()
+
+    from livejanus.live import WireDictionary
+
+    usernames, entries = generate_entries(arguments)
+    dictionary = WireDictionary(int(entries[0][0]), usernames)
+
+    def batched(encode):
+        return lambda batch: (
+            encode(batch[0])
+            if len(batch) == 1
+            else [batch[-1][2], [encode(entry) for entry in batch]]
+        )
+
+    encoders = {
+        "json": batched(lambda entry: entry),
+        "compact": batched(dictionary.encode),
+        "compact-binary": lambda batch: encode_binary(
+            [dictionary.encode(entry) for entry in batch]
+        ),
+    }
+    results = []
+    for batch_size in [1, arguments.batch]:
+        batches = [
+            entries[index : index + batch_size]
+            for index in range(0, len(entries), batch_size)
+        ]
+        for name in encoders:
+            result = measure(encoders, name, batches)
+            result.update({"format": name, "batch": batch_size})
+            results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
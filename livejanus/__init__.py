@@ -1,20 +1,45 @@
+from datetime import datetime
 from os import environ
 from os.path import abspath, dirname, join as pjoin
 
 import click
-import stripe
-from flask import Blueprint, make_response, redirect, render_template, request
-from flask_socketio import SocketIO, emit, join_room
+from flask import (
+    Blueprint,
+    Response,
+    jsonify,
+    make_response,
+    redirect,
+    render_template,
+    request,
+    stream_with_context,
+)
 
 from livejanus.util import (
-    SocketInvalidDataException,
     alphanumeric,
+    gzip_stream,
     is_debug,
     random_string,
     time_as_utc,
 )
 from .auth import auth_handler, socket_session_handler
-from .db import Event, EventUser, Record, StripeSession, User, db
+from .cache import model_cache
+from .db import (
+    Event,
+    EventSummary,
+    EventUser,
+    Record,
+    RecordRollup,
+    StripeSession,
+    User,
+    archive_job,
+    db,
+    init_db,
+    migrate_record_layout,
+    record_log_job,
+    write_behind_queue,
+)
+from .live import live_event_state_handler, room_presence_handler, update_batch_max
+from .metrics import metrics
 
 blueprint_root = dirname(abspath(__file__))
 livejanus = Blueprint(
@@ -25,9 +50,16 @@ livejanus = Blueprint(
     url_prefix="",
     static_url_path="",
 )
-livejanus_socketio = SocketIO()
+dashboard_page_size = int(environ.get("DASHBOARD_PAGE_SIZE", 20))
 
-stripe.api_key = environ.get("STRIPE_PRIVATE_KEY")
+metrics.gauge("livejanus_sockets", lambda: len(room_presence_handler))
+metrics.gauge("livejanus_rooms", lambda: room_presence_handler.room_count)
+metrics.gauge("livejanus_tokens", lambda: len(auth_handler))
+metrics.gauge("livejanus_socket_sessions", lambda: len(socket_session_handler))
+metrics.gauge("livejanus_model_cache_hits", lambda: model_cache.hits)
+metrics.gauge("livejanus_model_cache_misses", lambda: model_cache.misses)
+metrics.gauge("livejanus_write_behind_depth", lambda: len(write_behind_queue))
+metrics.gauge("livejanus_write_behind_failures", lambda: write_behind_queue.failures)
 
 
 def make_logged_in_response(session_token: str, redirect_url: str):
@@ -53,6 +85,8 @@ def set_event_premium(event_key: str):
         raise Exception(f"Event with key {event_key} was already premium.")
     event.is_premium = True
     db.session.commit()
+    model_cache.invalidate(Event, event.id)
+    live_event_state_handler.discard(event.id)
     print("Success")
 
 
@@ -65,6 +99,7 @@ def set_user_password(username: str, password: str):
         raise Exception(f"User with username {username} was not found.")
     user.set_password(password)
     db.session.commit()
+    model_cache.invalidate(User, user.id)
     print("Success")
 
 
@@ -84,7 +119,7 @@ def list_users():
 def list_events():
     for event in Event.query.order_by(Event.created_time).all():
         try:
-            event_owner = User.query.filter(User.id == event.owner).first().username
+            event_owner = User.from_id(event.owner).username
         except:
             event_owner = "<ERROR>"
         print(
@@ -92,6 +127,56 @@ def list_events():
         )
 
 
+@livejanus.cli.command("rollup")
+def rebuild_rollups():
+    RecordRollup.rebuild()
+    print("Success")
+
+
+@livejanus.cli.command("migrate-records")
+def migrate_records():
+    migrated = migrate_record_layout()
+    if migrated == 0:
+        print("Records already use the current layout")
+        return
+    print(f"Migrated {migrated} records")
+
+
+@livejanus.cli.command("archive")
+@click.option("--days", type=float, default=None)
+def archive_events(days: float):
+    age = None if days is None else days * 24 * 60 * 60
+    archive_job.enable_incremental_vacuum()
+    archived, pruned = archive_job.archive(age)
+    print(f"Archived {archived} events and pruned {pruned} Stripe sessions")
+
+
+@livejanus.cli.command("compact-records")
+def compact_record_logs():
+    print(f"Compacted {record_log_job.compact()} logged records")
+
+
+@livejanus.cli.command("fanout-broker")
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", default=5680)
+def run_fanout_broker(host: str, port: int):
+    from .fanout import LoopbackBroker
+
+    print(f"Loopback broker listening on {host}:{port}")
+    LoopbackBroker(host, port).serve_forever()
+
+
+@livejanus.cli.command("init-db")
+def initialise_database():
+    init_db()
+    print("Success")
+
+
+@livejanus.app_template_filter("utc_time")
+def format_utc_time(timestamp: float) -> str:
+    return datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M UTC")
+
+
 @livejanus.route("/")
 def page_splash():
     return render_template("splash.html")
@@ -148,7 +233,7 @@ def page_user_home():
         )
         if stripe_session is None:
             return fail_response
-        user = User.query.filter(User.id == stripe_session.user).first()
+        user = User.from_id(stripe_session.user)
         if user is None:
             return fail_response
         stripe_session.used = True
@@ -172,6 +257,9 @@ def page_user_home():
             host_root = request.referrer.split("/")[2]
             if "localhost" not in host_root and "." not in host_root:
                 raise Exception("Host root looks invalid, aborting")
+            import stripe
+
+            stripe.api_key = environ.get("STRIPE_PRIVATE_KEY")
             stripe_secret_session = random_string(length=128)
             stripe_checkout_session = stripe.checkout.Session.create(
                 payment_method_types=["card"],
@@ -199,10 +287,16 @@ def page_user_home():
             else:
                 db.session.add(Event(user.id, "Untitled Event"))
                 db.session.commit()
-    events = list(Event.query.filter(Event.owner == user.id))
-    events.sort(key=lambda x: x.created_time)
-    events.reverse()
-    return render_template("user.html", user=user, events=events, error_msg=error_msg)
+    page = max(1, request.args.get("page", 1, type=int))
+    events = EventSummary.page_for_owner(user.id, page, dashboard_page_size + 1)
+    return render_template(
+        "user.html",
+        user=user,
+        events=events[:dashboard_page_size],
+        page=page,
+        has_next_page=len(events) > dashboard_page_size,
+        error_msg=error_msg,
+    )
 
 
 @livejanus.route("/user/<event_key>/", methods=["GET", "POST"])
@@ -217,23 +311,8 @@ def page_user_event(event_key):
 
     error_msgs = []
     if request.method == "POST":
-        event.name = request.form["eventName"]
-        if "eventUserNew" in request.form and len(request.form["eventUserNew"]) > 0:
-            if (
-                not event.is_premium
-                and EventUser.query.filter(EventUser.event == event.id).count() > 2
-            ):
-                error_msgs.append("Basic events are limited to a maximum of 2 users.")
-            else:
-                db.session.add(
-                    EventUser(
-                        event.id, request.form["eventUserNew"], random_string(length=32)
-                    )
-                )
-
-        if "eventMax" in request.form:
-            event.max_value = int(request.form["eventMax"])
-
+        changed_users = []
+        changed_passwords = []
         for form_key in request.form.keys():
             if (
                 str(form_key).startswith("eventUserPassword_")
@@ -246,11 +325,30 @@ def page_user_event(event_key):
                     .first()
                 )
                 if changed_user is not None:
-                    changed_user.set_password(request.form[form_key])
+                    changed_users.append(changed_user)
+                    changed_passwords.append(request.form[form_key])
                 else:
                     error_msgs.append("Invalid user for password change.")
+        hashed_passwords = auth_handler.hash_many(changed_passwords)
+
+        event.name = request.form["eventName"]
+        if "eventUserNew" in request.form and len(request.form["eventUserNew"]) > 0:
+            if not event.is_premium and EventSummary.query.get(event.id).user_count > 2:
+                error_msgs.append("Basic events are limited to a maximum of 2 users.")
+            else:
+                db.session.add(EventUser(event.id, request.form["eventUserNew"]))
+
+        if "eventMax" in request.form:
+            event.max_value = int(request.form["eventMax"])
+
+        for changed_user, hashed_password in zip(changed_users, hashed_passwords):
+            changed_user.password = hashed_password
         try:
             db.session.commit()
+            model_cache.invalidate(Event, event.id)
+            for changed_user in changed_users:
+                model_cache.invalidate(EventUser, changed_user.id)
+            live_event_state_handler.discard(event.id)
         except:
             db.session.rollback()
             error_msgs.append(
@@ -265,6 +363,8 @@ def page_user_event(event_key):
         "event.html",
         event=event,
         event_users=event_users,
+        connected_count=room_presence_handler.count(event.key),
+        connected_usernames=sorted(room_presence_handler.usernames(event.key)),
         error_msg=" - ".join(error_msgs) if len(error_msgs) > 0 else None,
     )
 
@@ -286,10 +386,39 @@ def page_event_download(event_key):
         ]
     )
 
-    response = make_response(event.create_csv())
-    response.headers["Content-Disposition"] = f"attachment; filename={filename}.csv"
-    response.headers["Content-type"] = "text/csv"
-    return response
+    chunks = event.iter_csv()
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}.csv",
+        "Vary": "Accept-Encoding",
+    }
+    if "gzip" in request.accept_encodings:
+        chunks = gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(chunks), mimetype="text/csv", headers=headers)
+
+
+@livejanus.route("/user/<event_key>/rollup/", methods=["GET"])
+def page_event_rollup(event_key):
+    if "session" not in request.cookies:
+        return redirect(f"/user/")
+    user: User = auth_handler.validate(request.cookies["session"])
+    event = Event.from_key(event_key)
+    if user is None or event is None or event.owner != user.id:
+        return redirect(f"/user/")
+    if not event.is_premium:
+        return redirect(f"/user/{event_key}/")
+
+    try:
+        end_time = float(request.args.get("end", event.end_time or time_as_utc()))
+        start_time = float(
+            request.args.get("start", event.start_time or event.created_time)
+        )
+        bucket_size = int(request.args.get("bucket", 300))
+    except ValueError:
+        return jsonify(error="The start, end and bucket must be numbers"), 400
+    if end_time < start_time or bucket_size < 60:
+        return jsonify(error="The requested range or bucket size is invalid"), 400
+    return jsonify(RecordRollup.query_buckets(event, start_time, end_time, bucket_size))
 
 
 @livejanus.route("/event/login/", methods=["GET", "POST"])
@@ -329,6 +458,13 @@ def page_about():
     return render_template("about.html")
 
 
+@livejanus.route("/metrics")
+def page_metrics():
+    if not metrics.is_allowed(request.remote_addr):
+        return Response("Not Found", status=404, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @livejanus.route("/event/<event_key>/")
 def page_event_counter(event_key):
     fail_response = render_template(
@@ -346,7 +482,8 @@ def page_event_counter(event_key):
     ):
         return fail_response
 
-    if not event.is_happening:
+    event_state = event.live_state
+    if not event_state.is_happening:
         return render_template(
             "event_login.html",
             error_msg=f"The requested event is no longer available.",
@@ -356,48 +493,7 @@ def page_event_counter(event_key):
     return render_template(
         "counter.html",
         event=event,
-        event_max=event.max_value if event.max_value is not None else -1,
+        event_max=event_state.max_value if event_state.max_value is not None else -1,
         event_username=event_user.username,
+        batch_max=update_batch_max,
     )
-
-
-@livejanus_socketio.on("join")
-def socket_join(data):
-    try:
-        event_user: EventUser = auth_handler.validate(data)
-        if event_user is None:
-            raise SocketInvalidDataException("The session cookie was invalid")
-        event = Event.query.filter(Event.id == event_user.event).first()
-        if event is None:
-            raise SocketInvalidDataException("The event was not found")
-        socket_session_handler.save(
-            request.sid, event_user.username, event_user.id, event.key, event.id
-        )
-        join_room(event.key)
-        emit("join", event.total_value)
-    except Exception:
-        emit("join", False)
-
-
-@livejanus_socketio.on("update")
-def socket_update(data):
-    try:
-        session_data = socket_session_handler.fetch(request.sid)
-        if session_data is None:
-            raise SocketInvalidDataException("The session ID was not found")
-        event_user_name, event_user_id, event_key, event_id = session_data
-        if data not in [1, -1]:
-            raise SocketInvalidDataException(f'Update value "{data}" was invalid')
-        event = Event.query.filter(Event.id == event_id).first()
-        if not event.is_happening:
-            raise SocketInvalidDataException("The event has ended")
-
-        event = Event.query.filter(Event.id == event_id).first()
-        event.add_record(event_user_id, data)
-        emit(
-            "update",
-            [time_as_utc(), event_user_name, event.total_value, data],
-            room=event_key,
-        )
-    except Exception:
-        emit("update", False)
@@ -0,0 +1,162 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from os import environ
+
+import socketio
+
+from livejanus.db import archive_job, record_log_job, write_behind_queue
+from livejanus.handlers import (
+    handle_disconnect,
+    handle_join,
+    handle_update,
+    join_event_id,
+)
+from livejanus.limit import update_limiter
+from livejanus.live import broadcast_scheduler
+
+logger = getLogger(__name__)
+
+
+class AsyncSocketTransport:
+    def __init__(self, server: socketio.AsyncServer, loop):
+        self._server = server
+        self._loop = loop
+
+    def emit(self, event: str, data, room: str):
+        asyncio.run_coroutine_threadsafe(
+            self._server.emit(event, data, room=room), self._loop
+        )
+
+    def join_room(self, session_id: str, room: str):
+        self._loop.call_soon_threadsafe(self._server.enter_room, session_id, room)
+
+
+class AsyncSocketServer:
+    def __init__(self):
+        self.server = socketio.AsyncServer(async_mode="asgi")
+        self.server.on("join", self._join)
+        self.server.on("update", self._update)
+        self.server.on("disconnect", self._disconnect)
+        self._app = None
+        self._wsgi_app = None
+        self._transport = None
+        self._session_executors = {}
+        self._executors = [
+            ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"livejanus-handlers-{index}"
+            )
+            for index in range(int(environ.get("ASGI_HANDLER_THREADS", 4)))
+        ]
+        self._join_executor = ThreadPoolExecutor(
+            max_workers=len(self._executors), thread_name_prefix="livejanus-joins"
+        )
+        self._flush_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="livejanus-flush"
+        )
+        self._maintenance_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="livejanus-maintenance"
+        )
+
+    def init_app(self, app):
+        if environ.get("SOCKETIO_MESSAGE_QUEUE") is not None:
+            raise ValueError("The asyncio server does not support a message queue")
+        self._app = app
+        update_limiter.init_app(app)
+
+    def asgi_app(self):
+        from asgiref.wsgi import WsgiToAsgi
+
+        self._wsgi_app = WsgiToAsgi(self._app)
+        return socketio.ASGIApp(self.server, other_asgi_app=self._other_app)
+
+    async def call(self, executor: ThreadPoolExecutor, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, self._call_in_context, function, args
+        )
+
+    def event_executor(self, event_id: int) -> ThreadPoolExecutor:
+        return self._executors[event_id % len(self._executors)]
+
+    def _call_in_context(self, function, args):
+        with self._app.app_context():
+            return function(*args)
+
+    def _start(self):
+        self._transport = AsyncSocketTransport(self.server, asyncio.get_running_loop())
+        broadcast_scheduler.attach(self._transport)
+        tasks = [
+            (
+                broadcast_scheduler.enabled,
+                broadcast_scheduler.tick,
+                broadcast_scheduler.flush,
+                None,
+            ),
+            (
+                write_behind_queue.enabled,
+                write_behind_queue.flush_time,
+                write_behind_queue.flush,
+                self._flush_executor,
+            ),
+            (
+                archive_job.enabled,
+                archive_job.interval,
+                archive_job.run_once,
+                self._maintenance_executor,
+            ),
+            (
+                record_log_job.enabled,
+                record_log_job.interval,
+                record_log_job.run_once,
+                self._maintenance_executor,
+            ),
+        ]
+        for enabled, interval, function, executor in tasks:
+            if enabled:
+                self.server.start_background_task(
+                    self._repeat, interval, function, executor
+                )
+
+    async def _repeat(self, interval: float, function, executor):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if executor is None:
+                    function()
+                else:
+                    await self.call(executor, function)
+            except Exception:
+                logger.exception(f"Background task {function.__qualname__} failed")
+
+    async def _other_app(self, scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await self._wsgi_app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _join(self, session_id: str, data):
+        event_id = await self.call(self._join_executor, join_event_id, data)
+        executor = (
+            self._executors[0] if event_id is None else self.event_executor(event_id)
+        )
+        self._session_executors[session_id] = executor
+        await self.call(executor, handle_join, self._transport, session_id, data)
+
+    async def _update(self, session_id: str, data):
+        executor = self._session_executors.get(session_id, self._executors[0])
+        return await self.call(
+            executor, handle_update, self._transport, session_id, data
+        )
+
+    async def _disconnect(self, session_id: str):
+        executor = self._session_executors.pop(session_id, self._executors[0])
+        await self.call(executor, handle_disconnect, session_id)
+
+
+async_socket_server = AsyncSocketServer()
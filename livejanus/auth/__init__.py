@@ -1,33 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
 from os import environ
 from time import time
 from typing import Union
 
-from argon2 import PasswordHasher
-
+from livejanus.cache import model_cache
+from livejanus.metrics import metrics
+from livejanus.store import create_store
 from livejanus.util import is_debug, random_string
 
 
 class AuthHandler:
     def __init__(self):
-        self._password_hasher = PasswordHasher()
+        self._password_hasher = None
+        self._hash_pool_size = int(environ.get("HASH_POOL_SIZE", 4))
+        self._hash_pool = None
         self._salt = environ.get("HASH_SALT", "saltysalt")
-        self._tokens = {}
         self._expire_time = 60 * 60 * 24 * 7
         self._max_tokens = 2 ** 13
+        self._tokens = create_store("tokens", self._max_tokens)
         self._socket_ids = {}
 
+    def __len__(self):
+        return len(self._tokens)
+
     def salt(self, password: str):
         return f"{password}{self._salt}"
 
     def hash(self, password: str) -> str:
-        return self._password_hasher.hash(self.salt(password))
+        return self._offload(self._get_password_hasher().hash, self.salt(password))
+
+    def hash_many(self, passwords: list[str]) -> list[str]:
+        hash_password = self._get_password_hasher().hash
+        salted_passwords = [self.salt(password) for password in passwords]
+        if self._hash_pool_size <= 0:
+            return [hash_password(salted) for salted in salted_passwords]
+        if self._is_green():
+            from eventlet import GreenPool, tpool
+
+            return list(
+                GreenPool(self._hash_pool_size).imap(
+                    lambda salted: tpool.execute(hash_password, salted),
+                    salted_passwords,
+                )
+            )
+        return list(self._get_hash_pool().map(hash_password, salted_passwords))
 
+    @metrics.timed("livejanus_password_verify_seconds")
     def verify(self, password: str, hashed: str) -> bool:
         try:
-            return self._password_hasher.verify(hashed, self.salt(password))
+            return self._offload(
+                self._get_password_hasher().verify, hashed, self.salt(password)
+            )
+        except:
+            return False
+
+    def needs_rehash(self, hashed: str) -> bool:
+        try:
+            return self._get_password_hasher().check_needs_rehash(hashed)
         except:
             return False
 
+    def _offload(self, function, *args):
+        if self._hash_pool_size <= 0:
+            return function(*args)
+        if self._is_green():
+            from eventlet import tpool
+
+            return tpool.execute(function, *args)
+        return self._get_hash_pool().submit(function, *args).result()
+
+    def _get_password_hasher(self):
+        if self._password_hasher is None:
+            from argon2 import (
+                DEFAULT_MEMORY_COST,
+                DEFAULT_PARALLELISM,
+                DEFAULT_TIME_COST,
+                PasswordHasher,
+            )
+
+            self._password_hasher = PasswordHasher(
+                time_cost=int(environ.get("ARGON2_TIME_COST", DEFAULT_TIME_COST)),
+                memory_cost=int(environ.get("ARGON2_MEMORY_COST", DEFAULT_MEMORY_COST)),
+                parallelism=int(environ.get("ARGON2_PARALLELISM", DEFAULT_PARALLELISM)),
+            )
+        return self._password_hasher
+
+    def _get_hash_pool(self) -> ThreadPoolExecutor:
+        if self._hash_pool is None:
+            self._hash_pool = ThreadPoolExecutor(self._hash_pool_size)
+        return self._hash_pool
+
+    @staticmethod
+    def _is_green() -> bool:
+        try:
+            from eventlet import patcher
+        except ImportError:
+            return False
+        return patcher.is_monkey_patched("thread")
+
+    @metrics.timed("livejanus_authenticate_seconds")
     def authenticate(
         self, username: str, password: str, query_class: type, event_id: int = None
     ) -> Union[str, bool]:
@@ -45,44 +116,36 @@ class AuthHandler:
             result = True
         else:
             result = auth_handler.verify(password, user.password)
+            if result and self.needs_rehash(user.password):
+                user.password = self.hash(password)
+                query_class.query.session.commit()
+                model_cache.invalidate(query_class, user.id)
         if result:
             token = random_string(length=128)
             expiry = time() + self._expire_time
             if token in self._tokens:
                 return self.authenticate(username, password, query_class)
-            self._tokens[token] = (user.id, query_class, expiry)
-            self._clean_tokens()
+            self._tokens.set(token, (user.id, query_class), expiry)
+            self._tokens.clean()
             return token
         return False
 
     def validate(self, token: str):
-        if token not in self._tokens:
+        token_data = self._tokens.get(token)
+        if token_data is None:
             return None
-        user_id, query_class, expiry = self._tokens[token]
-        if self._is_expired(token):
-            del self._tokens[token]
-            return None
-        return query_class.query.filter(query_class.id == user_id).first()
-
-    def _is_expired(self, token: str):
-        user_id, query_class, expiry = self._tokens[token]
-        return time() > expiry
-
-    def _clean_tokens(self):
-        if len(self._tokens) < self._max_tokens:
-            return
-        queue = set()
-        for token in self._tokens.keys():
-            if self._is_expired(token):
-                queue.add(token)
-        for token in queue:
-            del self._tokens[token]
+        user_id, query_class = token_data
+        return query_class.from_id(user_id)
 
 
 class SocketSessionHandler:
     def __init__(self):
-        self._data = {}
         self._expire_time = 60 * 60 * 24 * 7
+        self._max_sessions = int(environ.get("SOCKET_SESSION_MAX", 2 ** 17))
+        self._data = create_store("sessions", self._max_sessions)
+
+    def __len__(self):
+        return len(self._data)
 
     def save(
         self,
@@ -92,25 +155,35 @@ class SocketSessionHandler:
         event_key: str,
         event_id: int,
     ):
-        self._data[session_id] = (
-            event_user_name,
-            event_user_id,
-            event_key,
-            event_id,
-            time(),
+        self._data.set(
+            session_id,
+            (event_user_name, event_user_id, event_key, event_id),
+            time() + self._expire_time,
         )
-        expired_session_ids = set()
-        for session_id in self._data.keys():
-            if time() - self._data[session_id][-1] > self._expire_time:
-                expired_session_ids.add(session_id)
-        for session_id in expired_session_ids:
-            del self._data[session_id]
+        self._data.clean()
 
     def fetch(self, session_id: str) -> Union[None, tuple[str, int, str, int]]:
-        if session_id not in self._data:
-            return None
-        return self._data[session_id][:-1]
+        return self._data.get(session_id)
+
+    def delete(self, session_id: str):
+        self._data.delete(session_id)
+
+
+class UpdateSequenceHandler:
+    def __init__(self):
+        self._expire_time = 60 * 60 * 24
+        self._data = create_store("sequences", 2 ** 17)
+
+    def is_duplicate(self, event_user_id: int, client_id: str, sequence: int) -> bool:
+        last_sequence = self._data.get(f"{event_user_id}:{client_id}")
+        return last_sequence is not None and sequence <= last_sequence
+
+    def accept(self, event_user_id: int, client_id: str, sequence: int):
+        self._data.set(
+            f"{event_user_id}:{client_id}", sequence, time() + self._expire_time
+        )
 
 
 auth_handler = AuthHandler()
 socket_session_handler = SocketSessionHandler()
+update_sequence_handler = UpdateSequenceHandler()
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from os import environ
+from threading import Lock
+from time import time
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+class ModelCache:
+    def __init__(self):
+        self._max_size = int(environ.get("MODEL_CACHE_SIZE", 4096))
+        self._expire_time = float(environ.get("MODEL_CACHE_TIME", 30))
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def fetch(self, query_class: type, instance_id: int):
+        if instance_id is None:
+            return None
+        key = (query_class.__name__, instance_id)
+        cached = self._get(key)
+        if cached is not None:
+            self.hits += 1
+            return query_class.query.session.merge(cached, load=False)
+        self.misses += 1
+        instance = query_class.query.filter(query_class.id == instance_id).first()
+        if instance is not None and not inspect(instance).modified:
+            self._set(key, self._detached_copy(instance))
+        return instance
+
+    def fetch_by(self, query_class: type, column_name: str, value):
+        key = (query_class.__name__, column_name, value)
+        instance_id = self._get(key)
+        if instance_id is not None:
+            return self.fetch(query_class, instance_id)
+        self.misses += 1
+        instance = query_class.query.filter(
+            getattr(query_class, column_name) == value
+        ).first()
+        if instance is not None and not inspect(instance).modified:
+            self._set(key, instance.id)
+            self._set(
+                (query_class.__name__, instance.id), self._detached_copy(instance)
+            )
+        return instance
+
+    def invalidate(self, query_class: type, instance_id: int):
+        with self._lock:
+            self._entries.pop((query_class.__name__, instance_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expiry = entry
+            if time() > expiry:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time() + self._expire_time)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _detached_copy(instance):
+        mapper = inspect(instance).mapper
+        copy = mapper.class_manager.new_instance()
+        uncached_columns = getattr(mapper.class_, "uncached_columns", [])
+        for column in mapper.column_attrs:
+            if column.key in uncached_columns:
+                continue
+            set_committed_value(copy, column.key, getattr(instance, column.key))
+        make_transient_to_detached(copy)
+        return copy
+
+
+model_cache = ModelCache()
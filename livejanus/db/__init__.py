@@ -1,17 +1,135 @@
+from array import array
+from atexit import register as atexit_register
+from contextlib import contextmanager
 from csv import writer as csv_writer
 from datetime import datetime
 from io import StringIO
-from typing import Union
+from logging import getLogger
+from sqlite3 import sqlite_version_info
+from os import environ
+from struct import pack, unpack_from
+from sys import byteorder
+from threading import Lock
+from typing import Iterator, Union
+from zlib import compress, decompress
 
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import event
-from sqlalchemy.engine import Engine
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import (
+    Integer,
+    case,
+    cast,
+    create_engine,
+    event,
+    or_,
+    orm,
+    select,
+    text,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.sql import func
 
 from livejanus.auth import auth_handler
-from livejanus.util import random_string, time_as_utc
+from livejanus.cache import model_cache
+from livejanus.live import live_event_state_handler
+from livejanus.metrics import metrics
+from livejanus.recordlog import record_log_store
+from livejanus.util import as_microseconds, random_string, time_as_utc
 
-db = SQLAlchemy()
+logger = getLogger(__name__)
+update_returning = sqlite_version_info >= (3, 35, 0)
+
+
+class StorageProfile:
+    def __init__(self):
+        self.name = environ.get("SQLITE_PROFILE", "wal").lower()
+        if self.name not in ["wal", "memory"]:
+            raise ValueError(f"Unknown SQLite profile {self.name}")
+        self._synchronous = environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+        self._busy_timeout = int(environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+        self._mmap_size = int(environ.get("SQLITE_MMAP_SIZE", 2 ** 28))
+        self._cache_size = int(environ.get("SQLITE_CACHE_SIZE", -16000))
+        self._reader_pool_size = int(environ.get("SQLITE_READER_POOL_SIZE", 4))
+        self.reader = None
+
+    def init_app(self, app):
+        url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+        if self.name != "wal" or url.get_backend_name() != "sqlite":
+            return
+        if url.database in [None, "", ":memory:"]:
+            return
+        connect_args = {"check_same_thread": False}
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {}).update(
+            poolclass=QueuePool, pool_size=1, max_overflow=0, connect_args=connect_args
+        )
+        self.reader = create_engine(
+            db.get_engine(app).url,
+            poolclass=QueuePool,
+            pool_size=self._reader_pool_size,
+            max_overflow=0,
+            connect_args=connect_args,
+        )
+        event.listen(self.reader, "connect", self._set_query_only)
+
+    def apply(self, connection):
+        cursor = connection.cursor()
+        if self.name == "memory":
+            cursor.execute("PRAGMA journal_mode = MEMORY")
+        else:
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute(f"PRAGMA synchronous = {self._synchronous}")
+            cursor.execute(f"PRAGMA busy_timeout = {self._busy_timeout}")
+            cursor.execute(f"PRAGMA mmap_size = {self._mmap_size}")
+            cursor.execute(f"PRAGMA cache_size = {self._cache_size}")
+        cursor.close()
+
+    @staticmethod
+    def _set_query_only(connection, connection_record):
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        if storage_profile.reader is None or self.info.get("writer"):
+            return super().get_bind(mapper, clause)
+        if self._flushing or not getattr(clause, "is_select", False):
+            self.info["writer"] = True
+            return super().get_bind(mapper, clause)
+        return storage_profile.reader
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def reset_session_routing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("writer", None)
+
+
+storage_profile = StorageProfile()
+db = RoutingSQLAlchemy()
+
+
+@contextmanager
+def read_transaction():
+    if storage_profile.reader is None or db.session.info.get("writer"):
+        connection = db.session.connection()
+        if not connection.connection.in_transaction:
+            connection.exec_driver_sql("BEGIN")
+        yield connection
+        return
+    with storage_profile.reader.connect() as connection:
+        with connection.begin():
+            connection.exec_driver_sql("BEGIN")
+            yield connection
 
 
 class User(db.Model):
@@ -33,6 +151,10 @@ class User(db.Model):
     def set_password(self, password: str):
         self.password = auth_handler.hash(password)
 
+    @classmethod
+    def from_id(cls, user_id: int) -> "User":
+        return model_cache.fetch(User, user_id)
+
     @classmethod
     def authenticate(cls, username: str, password: str) -> Union[str, bool]:
         response = auth_handler.authenticate(username, password, User)
@@ -46,6 +168,7 @@ class User(db.Model):
 
 class Event(db.Model):
     __tablename__ = "event"
+    __table_args__ = (db.Index("_owner_created", "owner", "created_time"),)
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     owner = db.Column(
         db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False
@@ -59,6 +182,8 @@ class Event(db.Model):
     created_time = db.Column(db.Float, nullable=False)
     lazy_records = db.Column(db.Integer, nullable=False)
 
+    uncached_columns = ["lazy_records"]
+
     def __init__(
         self,
         owner_id: int,
@@ -111,56 +236,179 @@ class Event(db.Model):
             return False
         return time_as_utc() >= self.end_time
 
-    def add_record(self, user_id: int, value: int):
-        if value not in [-1, 1]:
+    @metrics.timed("livejanus_add_record_seconds")
+    def add_record(
+        self, user_id: int, value: int, enforce_max: bool = False
+    ) -> tuple[int, Union[None, int]]:
+        if type(value) != int or value == 0:
             raise ValueError("Invalid value for record")
+        state = live_event_state_handler.fetch_event(self)
+        records = []
+        record_time = None
+        lazy_records = None
         if self.is_premium:
-            record = Record(user_id, self.id, value)
-            db.session.add(record)
+            first_time = record_clock.reserve(abs(value))
+            record_time = first_time / 1_000_000
+            if record_log_store.enabled:
+                record_log_store.append(self.id, user_id, first_time, value)
+                return state.add(value, record_time), None
+            records = [
+                Record(user_id, self.id, 1 if value > 0 else -1, first_time + i)
+                for i in range(abs(value))
+            ]
+        counted_value = value
+        if self.is_premium and self.start_time is not None:
+            if not self.start_time <= record_time <= self.end_time:
+                counted_value = 0
+        activity_time = time_as_utc()
+        if write_behind_queue.enabled:
+            write_behind_queue.put(
+                self.id, value, records, counted_value, activity_time
+            )
+            return state.add(value, record_time), None
+        if len(records) > 0:
+            db.session.add_all(records)
+            RecordRollup.add(db.session, [record.as_row() for record in records])
         else:
-            self.lazy_records += value
+            lazy_records = Event.increment_lazy_records(
+                db.session, self.id, value, self.max_value if enforce_max else None
+            )
+            if lazy_records is None:
+                db.session.rollback()
+                raise ValueError("The event has reached its maximum value")
+            set_committed_value(self, "lazy_records", lazy_records)
+        summary = EventSummary.apply_returning(
+            db.session, self.id, counted_value, len(records), activity_time
+        )
         db.session.commit()
-        return self.total_value
+        if summary is None:
+            return state.add(value, record_time), None
+        total, sequence = summary
+        return state.set_total(total, lazy_records), sequence
+
+    @staticmethod
+    def increment_lazy_records(
+        session, event_id: int, value: int, max_value: int = None
+    ) -> Union[None, int]:
+        statement = (
+            "UPDATE event SET lazy_records = lazy_records + :value "
+            "WHERE id = :event_id"
+        )
+        if max_value is not None and max_value >= 0 and value > 0:
+            statement += " AND lazy_records + :value <= :max_value"
+        parameters = {"event_id": event_id, "value": value, "max_value": max_value}
+        if update_returning:
+            return session.execute(
+                text(statement + " RETURNING lazy_records"), parameters
+            ).scalar()
+        if session.execute(text(statement), parameters).rowcount == 0:
+            return None
+        return session.execute(
+            text("SELECT lazy_records FROM event WHERE id = :event_id"), parameters
+        ).scalar()
 
     @classmethod
     def from_key(cls, key: str) -> "Event":
-        return Event.query.filter(Event.key == key).first()
+        return model_cache.fetch_by(Event, "key", key)
+
+    @classmethod
+    def from_id(cls, event_id: int) -> "Event":
+        return model_cache.fetch(Event, event_id)
+
+    @property
+    def live_state(self):
+        return live_event_state_handler.fetch_event(self)
 
     @property
+    @metrics.timed("livejanus_total_value_seconds")
     def total_value(self) -> int:
+        return self.live_state.total
+
+    def query_total_value(self) -> int:
         if self.is_premium:
-            query = db.session.query(func.sum(Record.value)).filter(
+            query = select(func.coalesce(func.sum(Record.value), 0)).where(
                 Record.event == self.id
             )
             if self.start_time is not None:
-                query = query.filter(Record.time >= self.start_time)
-                query = query.filter(Record.time <= self.end_time)
-            try:
-                record_total = int(query.all()[0][0])
-            except TypeError:
-                record_total = 0
-            return self.lazy_records + record_total
-        return self.lazy_records
+                query = query.where(Record.time >= as_microseconds(self.start_time))
+                query = query.where(Record.time <= as_microseconds(self.end_time))
+            if record_log_store.enabled:
+                with read_transaction() as connection:
+                    record_total = connection.execute(query).scalar()
+                    record_total += self.query_log_total(connection)
+            else:
+                record_total = db.session.execute(query).scalar()
+            if self.is_finished:
+                record_total += RecordArchive.total_for(self.id)
+        else:
+            record_total = 0
+        return (
+            self.lazy_records + record_total + write_behind_queue.pending_value(self.id)
+        )
+
+    def query_log_total(self, connection) -> int:
+        compacted = dict(
+            connection.execute(
+                select(RecordLogOffset.log, RecordLogOffset.compacted).where(
+                    RecordLogOffset.event == self.id
+                )
+            ).all()
+        )
+        start_time = end_time = None
+        if self.start_time is not None:
+            start_time = as_microseconds(self.start_time)
+            end_time = as_microseconds(self.end_time)
+        return sum(
+            log.sum_range(compacted.get(name, 0), start_time, end_time)
+            for name, log in record_log_store.logs(self.id).items()
+        )
 
+    @metrics.timed("livejanus_create_csv_seconds")
     def create_csv(self):
+        return "".join(self.iter_csv())
+
+    def iter_csv(self, chunk_size: int = 1000):
+        write_behind_queue.flush()
+        if record_log_store.enabled:
+            record_log_job.compact_event(self.id)
         string_io = StringIO()
         writer = csv_writer(string_io)
         writer.writerow(["Timestamp (UTC)", "Recording User", "Value"])
         if self.lazy_records != 0:
             writer.writerow([0, "Undetailed Records", self.lazy_records])
-        user_id_map = {}
-        for record in Record.query.filter(Record.event == self.id).order_by(
-            Record.time
-        ):
-            if record.user not in user_id_map:
-                eventuser = EventUser.query.filter(EventUser.id == record.user).first()
-                if eventuser is None:
-                    username = "Unknown"
-                else:
-                    username = eventuser.username
-                user_id_map[record.user] = username
-            writer.writerow([int(record.time), user_id_map[record.user], record.value])
-        return string_io.getvalue()
+        archive = RecordArchive.query.filter(RecordArchive.event == self.id).first()
+        if archive is not None:
+            usernames = dict(
+                db.session.query(EventUser.id, EventUser.username).filter(
+                    EventUser.event == self.id
+                )
+            )
+            for record_time, user_id, value in archive.iter_rows():
+                writer.writerow(
+                    [record_time // 1_000_000, usernames.get(user_id, "Unknown"), value]
+                )
+                if string_io.tell() >= 2 ** 16:
+                    yield string_io.getvalue()
+                    string_io.seek(0)
+                    string_io.truncate()
+        query = (
+            db.session.query(
+                Record.time,
+                func.coalesce(EventUser.username, "Unknown"),
+                Record.value,
+            )
+            .outerjoin(EventUser, EventUser.id == Record.user)
+            .filter(Record.event == self.id)
+            .order_by(Record.time)
+            .yield_per(chunk_size)
+        )
+        for record_time, username, value in query:
+            writer.writerow([record_time // 1_000_000, username, value])
+            if string_io.tell() >= 2 ** 16:
+                yield string_io.getvalue()
+                string_io.seek(0)
+                string_io.truncate()
+        yield string_io.getvalue()
 
 
 class EventUser(db.Model):
@@ -174,15 +422,31 @@ class EventUser(db.Model):
     password = db.Column(db.String, nullable=False)
     created_time = db.Column(db.Float, nullable=False)
 
-    def __init__(self, event_id: int, username: str, password: str):
+    def __init__(self, event_id: int, username: str, password: str = None):
         self.event = event_id
         self.username = username
-        self.set_password(password)
+        if password is None:
+            self.password = ""
+        else:
+            self.set_password(password)
         self.created_time = time_as_utc()
 
     def set_password(self, password: str):
         self.password = auth_handler.hash(password)
 
+    @classmethod
+    def from_id(cls, event_user_id: int) -> "EventUser":
+        return model_cache.fetch(EventUser, event_user_id)
+
+    @classmethod
+    def usernames_for(cls, event_id: int) -> list[str]:
+        return [
+            username
+            for (username,) in db.session.query(cls.username)
+            .filter(cls.event == event_id)
+            .order_by(cls.id)
+        ]
+
     @classmethod
     def authenticate(
         cls, username: str, password: str, event_id: int
@@ -193,8 +457,8 @@ class EventUser(db.Model):
 class Record(db.Model):
     __tablename__ = "record"
     __table_args__ = (
-        db.Index("_event", "event"),
-        db.PrimaryKeyConstraint("user", "time"),
+        db.PrimaryKeyConstraint("event", "time", "user"),
+        {"sqlite_with_rowid": False},
     )
     user = db.Column(
         db.Integer, db.ForeignKey("eventuser.id", ondelete="CASCADE"), nullable=False
@@ -202,17 +466,501 @@ class Record(db.Model):
     event = db.Column(
         db.Integer, db.ForeignKey("event.id", ondelete="CASCADE"), nullable=False
     )
-    time = db.Column(db.Float, nullable=False)
+    time = db.Column(db.BigInteger, nullable=False)
     value = db.Column(db.SmallInteger, nullable=False)
 
-    def __init__(self, user_id: int, event_id: int, value: int):
+    def __init__(
+        self, user_id: int, event_id: int, value: int, record_time: int = None
+    ):
         if abs(value) != 1:
             raise ValueError(f"Invalid value {value} given for Record")
-        self.time = time_as_utc()
+        self.time = record_clock.reserve(1) if record_time is None else record_time
         self.user = user_id
         self.event = event_id
         self.value = value
 
+    def as_row(self) -> dict:
+        return {
+            "user": self.user,
+            "event": self.event,
+            "time": self.time,
+            "value": self.value,
+        }
+
+    @classmethod
+    def has_legacy_layout(cls, connection) -> bool:
+        table_sql = connection.execute(
+            text(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'record'"
+            )
+        ).scalar()
+        return table_sql is not None and "WITHOUT ROWID" not in table_sql.upper()
+
+    @classmethod
+    def migrate_layout(cls, connection) -> int:
+        if not cls.has_legacy_layout(connection):
+            return 0
+        connection.execute(text("ALTER TABLE record RENAME TO record_legacy"))
+        connection.execute(text("DROP INDEX IF EXISTS _event"))
+        cls.__table__.create(connection)
+        legacy_rows = connection.execute(
+            text(
+                "SELECT event, user, time, value FROM record_legacy "
+                "ORDER BY event, user, time"
+            )
+        )
+        migrated = 0
+        previous = None
+        while True:
+            batch = legacy_rows.fetchmany(10_000)
+            if len(batch) == 0:
+                break
+            rows = []
+            for event_id, user_id, legacy_time, value in batch:
+                record_time = round(legacy_time * 1_000_000)
+                if previous is not None and previous[:2] == (event_id, user_id):
+                    record_time = max(record_time, previous[2] + 1)
+                previous = (event_id, user_id, record_time)
+                rows.append(
+                    {
+                        "event": event_id,
+                        "user": user_id,
+                        "time": record_time,
+                        "value": value,
+                    }
+                )
+            connection.execute(cls.__table__.insert(), rows)
+            migrated += len(rows)
+        connection.execute(text("DROP TABLE record_legacy"))
+        return migrated
+
+
+class RecordRollup(db.Model):
+    __tablename__ = "record_rollup"
+    __table_args__ = (db.PrimaryKeyConstraint("event", "minute", "user"),)
+    event = db.Column(
+        db.Integer, db.ForeignKey("event.id", ondelete="CASCADE"), nullable=False
+    )
+    minute = db.Column(db.Integer, nullable=False)
+    user = db.Column(
+        db.Integer, db.ForeignKey("eventuser.id", ondelete="CASCADE"), nullable=False
+    )
+    delta = db.Column(db.Integer, nullable=False)
+    ins = db.Column(db.Integer, nullable=False)
+    outs = db.Column(db.Integer, nullable=False)
+
+    @classmethod
+    def add(cls, executor, record_rows: list[dict]):
+        rollups = {}
+        for row in record_rows:
+            key = (row["event"], row["time"] // 60_000_000, row["user"])
+            delta, ins, outs = rollups.get(key, (0, 0, 0))
+            rollups[key] = (
+                delta + row["value"],
+                ins + (1 if row["value"] > 0 else 0),
+                outs + (1 if row["value"] < 0 else 0),
+            )
+        if len(rollups) == 0:
+            return
+        statement = sqlite_insert(cls.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=["event", "minute", "user"],
+            set_={
+                "delta": cls.__table__.c.delta + statement.excluded.delta,
+                "ins": cls.__table__.c.ins + statement.excluded.ins,
+                "outs": cls.__table__.c.outs + statement.excluded.outs,
+            },
+        )
+        executor.execute(
+            statement,
+            [
+                {
+                    "event": event_id,
+                    "minute": minute,
+                    "user": user_id,
+                    "delta": delta,
+                    "ins": ins,
+                    "outs": outs,
+                }
+                for (event_id, minute, user_id), (delta, ins, outs) in rollups.items()
+            ],
+        )
+
+    @classmethod
+    def rebuild(cls):
+        minute = cast(Record.time / 60_000_000, Integer)
+        db.session.execute(cls.__table__.delete())
+        db.session.execute(
+            cls.__table__.insert().from_select(
+                ["event", "minute", "user", "delta", "ins", "outs"],
+                select(
+                    Record.event,
+                    minute,
+                    Record.user,
+                    func.sum(Record.value),
+                    func.sum(case((Record.value > 0, 1), else_=0)),
+                    func.sum(case((Record.value < 0, 1), else_=0)),
+                ).group_by(Record.event, minute, Record.user),
+            )
+        )
+        for archive in RecordArchive.query.yield_per(1):
+            rows = []
+            for record_time, user_id, value in archive.iter_rows():
+                rows.append(
+                    {
+                        "event": archive.event,
+                        "time": record_time,
+                        "user": user_id,
+                        "value": value,
+                    }
+                )
+                if len(rows) >= RecordArchive.chunk_size:
+                    cls.add(db.session, rows)
+                    rows = []
+            cls.add(db.session, rows)
+        db.session.commit()
+
+    @classmethod
+    def query_buckets(
+        cls, event: Event, start_time: float, end_time: float, bucket_size: int
+    ) -> dict:
+        if record_log_store.enabled:
+            record_log_job.compact_event(event.id)
+        start_minute = int(start_time // 60)
+        end_minute = int(end_time // 60)
+        bucket_minutes = max(1, bucket_size // 60)
+        usernames = dict(
+            db.session.query(EventUser.id, EventUser.username).filter(
+                EventUser.event == event.id
+            )
+        )
+        initial_total = event.lazy_records + (
+            db.session.query(func.coalesce(func.sum(cls.delta), 0))
+            .filter(cls.event == event.id)
+            .filter(cls.minute < start_minute)
+            .scalar()
+        )
+        minutes = (
+            db.session.query(cls.minute, cls.user, cls.delta, cls.ins, cls.outs)
+            .filter(cls.event == event.id)
+            .filter(cls.minute >= start_minute)
+            .filter(cls.minute <= end_minute)
+            .order_by(cls.minute)
+        )
+
+        buckets = []
+        total = initial_total
+        last_minute = None
+        last_bucket = None
+        for minute, user_id, delta, ins, outs in minutes:
+            if minute != last_minute and last_bucket is not None:
+                last_bucket["peak"] = max(last_bucket["peak"], total)
+            bucket_time = 60 * (
+                start_minute
+                + (minute - start_minute) // bucket_minutes * bucket_minutes
+            )
+            if len(buckets) == 0 or buckets[-1]["time"] != bucket_time:
+                buckets.append(
+                    {
+                        "time": bucket_time,
+                        "delta": 0,
+                        "ins": 0,
+                        "outs": 0,
+                        "total": total,
+                        "peak": total,
+                        "users": {},
+                    }
+                )
+            bucket = buckets[-1]
+            total += delta
+            username = usernames.get(user_id, "Unknown")
+            bucket["delta"] += delta
+            bucket["ins"] += ins
+            bucket["outs"] += outs
+            bucket["total"] = total
+            bucket["users"][username] = bucket["users"].get(username, 0) + delta
+            last_minute = minute
+            last_bucket = bucket
+        if last_bucket is not None:
+            last_bucket["peak"] = max(last_bucket["peak"], total)
+        return {
+            "start": start_minute * 60,
+            "end": end_minute * 60 + 59,
+            "bucket": bucket_minutes * 60,
+            "initial_total": initial_total,
+            "buckets": buckets,
+        }
+
+
+class EventSummary(db.Model):
+    __tablename__ = "event_summary"
+    event = db.Column(
+        db.Integer,
+        db.ForeignKey("event.id", ondelete="CASCADE"),
+        nullable=False,
+        primary_key=True,
+    )
+    total = db.Column(db.Integer, nullable=False)
+    user_count = db.Column(db.Integer, nullable=False)
+    record_count = db.Column(db.Integer, nullable=False)
+    last_activity = db.Column(db.Float, nullable=True)
+    sequence = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    @classmethod
+    def apply(
+        cls,
+        executor,
+        event_id: int,
+        total: int,
+        record_count: int,
+        activity_time: float,
+    ):
+        executor.execute(
+            cls.__table__.update()
+            .where(cls.event == event_id)
+            .values(
+                total=cls.total + total,
+                record_count=cls.record_count + record_count,
+                last_activity=activity_time,
+            )
+        )
+
+    @classmethod
+    def apply_returning(
+        cls,
+        session,
+        event_id: int,
+        total: int,
+        record_count: int,
+        activity_time: float,
+    ) -> Union[None, tuple[int, int]]:
+        statement = (
+            "UPDATE event_summary SET total = total + :total, "
+            "record_count = record_count + :record_count, "
+            "last_activity = :activity_time, sequence = sequence + 1 "
+            "WHERE event = :event_id"
+        )
+        parameters = {
+            "event_id": event_id,
+            "total": total,
+            "record_count": record_count,
+            "activity_time": activity_time,
+        }
+        if update_returning:
+            return session.execute(
+                text(statement + " RETURNING total, sequence"), parameters
+            ).first()
+        session.execute(text(statement), parameters)
+        return session.execute(
+            text("SELECT total, sequence FROM event_summary WHERE event = :event_id"),
+            parameters,
+        ).first()
+
+    @classmethod
+    def current_for(cls, event_id: int) -> Union[None, tuple[int, int]]:
+        return (
+            db.session.query(cls.total, cls.sequence)
+            .filter(cls.event == event_id)
+            .first()
+        )
+
+    @classmethod
+    def page_for_owner(
+        cls, owner_id: int, page: int, page_size: int
+    ) -> list[tuple[Event, "EventSummary"]]:
+        return (
+            db.session.query(Event, cls)
+            .outerjoin(cls, cls.event == Event.id)
+            .filter(Event.owner == owner_id)
+            .order_by(Event.created_time.desc())
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+            .all()
+        )
+
+    @classmethod
+    def backfill(cls):
+        for index in Event.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        with db.engine.begin() as connection:
+            columns = [
+                row[1]
+                for row in connection.execute(text("PRAGMA table_info(event_summary)"))
+            ]
+            if "sequence" not in columns:
+                connection.execute(
+                    text(
+                        "ALTER TABLE event_summary "
+                        "ADD COLUMN sequence INTEGER NOT NULL DEFAULT 0"
+                    )
+                )
+        missing = Event.query.filter(Event.id.not_in(select(cls.event))).all()
+        for event in missing:
+            record_count = (
+                Record.query.filter(Record.event == event.id).count()
+                + db.session.query(
+                    func.coalesce(func.sum(RecordArchive.record_count), 0)
+                )
+                .filter(RecordArchive.event == event.id)
+                .scalar()
+            )
+            last_time = (
+                db.session.query(func.max(Record.time))
+                .filter(Record.event == event.id)
+                .scalar()
+            )
+            db.session.add(
+                cls(
+                    event=event.id,
+                    total=event.query_total_value(),
+                    user_count=EventUser.query.filter(
+                        EventUser.event == event.id
+                    ).count(),
+                    record_count=record_count,
+                    last_activity=None if last_time is None else last_time / 1_000_000,
+                )
+            )
+        db.session.commit()
+
+
+@event.listens_for(Event, "after_insert")
+def create_event_summary(mapper, connection, target: Event):
+    connection.execute(
+        EventSummary.__table__.insert().values(
+            event=target.id, total=0, user_count=0, record_count=0
+        )
+    )
+
+
+@event.listens_for(EventUser, "after_insert")
+def count_event_user(mapper, connection, target: EventUser):
+    connection.execute(
+        EventSummary.__table__.update()
+        .where(EventSummary.event == target.event)
+        .values(user_count=EventSummary.user_count + 1)
+    )
+
+
+@event.listens_for(EventUser, "after_delete")
+def uncount_event_user(mapper, connection, target: EventUser):
+    connection.execute(
+        EventSummary.__table__.update()
+        .where(EventSummary.event == target.event)
+        .values(user_count=EventSummary.user_count - 1)
+    )
+
+
+class RecordArchive(db.Model):
+    __tablename__ = "record_archive"
+    event = db.Column(
+        db.Integer,
+        db.ForeignKey("event.id", ondelete="CASCADE"),
+        nullable=False,
+        primary_key=True,
+    )
+    record_count = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_time = db.Column(db.Float, nullable=False)
+
+    chunk_size = 4096
+
+    def __init__(self, event_id: int, record_count: int, total: int, data: bytes):
+        self.event = event_id
+        self.record_count = record_count
+        self.total = total
+        self.data = data
+        self.created_time = time_as_utc()
+
+    @classmethod
+    def total_for(cls, event_id: int) -> int:
+        return (
+            db.session.query(func.coalesce(func.sum(cls.total), 0))
+            .filter(cls.event == event_id)
+            .scalar()
+        )
+
+    @classmethod
+    def archive_event(cls, event: Event) -> int:
+        start_time = end_time = None
+        if event.start_time is not None:
+            start_time = as_microseconds(event.start_time)
+            end_time = as_microseconds(event.end_time)
+        query = (
+            db.session.query(Record.time, Record.user, Record.value)
+            .filter(Record.event == event.id)
+            .order_by(Record.time)
+            .yield_per(cls.chunk_size)
+        )
+        data = bytearray()
+        rows = []
+        record_count = total = 0
+        for row in query:
+            rows.append(row)
+            record_count += 1
+            if start_time is None or start_time <= row[0] <= end_time:
+                total += row[2]
+            if len(rows) >= cls.chunk_size:
+                data += cls.encode_chunk(rows)
+                rows = []
+        if len(rows) > 0:
+            data += cls.encode_chunk(rows)
+        db.session.add(cls(event.id, record_count, total, bytes(data)))
+        Record.query.filter(Record.event == event.id).delete(synchronize_session=False)
+        db.session.commit()
+        live_event_state_handler.discard(event.id)
+        return record_count
+
+    @staticmethod
+    def encode_chunk(rows: list[tuple[int, int, int]]) -> bytes:
+        previous_time = 0
+        deltas = array("q")
+        for record_time, _, _ in rows:
+            deltas.append(record_time - previous_time)
+            previous_time = record_time
+        users = array("i", [row[1] for row in rows])
+        values = array("b", [row[2] for row in rows])
+        if byteorder == "big":
+            for column in [deltas, users, values]:
+                column.byteswap()
+        chunk = compress(
+            pack("<I", len(rows))
+            + deltas.tobytes()
+            + users.tobytes()
+            + values.tobytes()
+        )
+        return pack("<I", len(chunk)) + chunk
+
+    def iter_rows(self) -> Iterator[tuple[int, int, int]]:
+        data = memoryview(self.data)
+        offset = 0
+        while offset < len(data):
+            (length,) = unpack_from("<I", data, offset)
+            chunk = decompress(data[offset + 4 : offset + 4 + length])
+            offset += 4 + length
+            (count,) = unpack_from("<I", chunk)
+            deltas, users, values = array("q"), array("i"), array("b")
+            position = 4
+            for column in [deltas, users, values]:
+                end = position + count * column.itemsize
+                column.frombytes(chunk[position:end])
+                position = end
+                if byteorder == "big":
+                    column.byteswap()
+            record_time = 0
+            for delta, user_id, value in zip(deltas, users, values):
+                record_time += delta
+                yield record_time, user_id, value
+
+
+class RecordLogOffset(db.Model):
+    __tablename__ = "record_log_offset"
+    event = db.Column(
+        db.Integer, db.ForeignKey("event.id", ondelete="CASCADE"), primary_key=True
+    )
+    log = db.Column(db.String, primary_key=True)
+    compacted = db.Column(db.Integer, nullable=False)
+
 
 class StripeSession(db.Model):
     __tablename__ = "stripe"
@@ -230,8 +978,351 @@ class StripeSession(db.Model):
         self.used = False
 
 
+class RecordClock:
+    def __init__(self):
+        self._last_time = 0
+        self._lock = Lock()
+
+    def reserve(self, count: int) -> int:
+        with self._lock:
+            first_time = max(as_microseconds(time_as_utc()), self._last_time + 1)
+            self._last_time = first_time + count - 1
+        return first_time
+
+
+class WriteBehindQueue:
+    def __init__(self):
+        self.enabled = str(environ.get("WRITE_BEHIND", False)).lower() == "true"
+        self.flush_time = float(environ.get("WRITE_BEHIND_FLUSH_TIME", 0.25))
+        self._flush_size = int(environ.get("WRITE_BEHIND_FLUSH_SIZE", 256))
+        self._max_size = int(environ.get("WRITE_BEHIND_MAX_SIZE", 65536))
+        self.failures = 0
+        self._app = None
+        self._records = []
+        self._lazy_records = {}
+        self._summaries = {}
+        self._pending_values = {}
+        self._size = 0
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self._app = app
+        if self.enabled:
+            atexit_register(self.flush)
+
+    def __len__(self):
+        return self._size
+
+    def put(
+        self,
+        event_id: int,
+        value: int,
+        records: list["Record"],
+        counted_value: int,
+        activity_time: float,
+    ):
+        with self._lock:
+            if self._size >= self._max_size:
+                metrics.increment("livejanus_write_behind_refused_total")
+                raise ValueError("The write-behind queue is full")
+            if len(records) > 0:
+                self._records.extend(record.as_row() for record in records)
+            else:
+                self._lazy_records[event_id] = (
+                    self._lazy_records.get(event_id, 0) + value
+                )
+            total, record_count, _ = self._summaries.get(event_id, (0, 0, None))
+            self._summaries[event_id] = (
+                total + counted_value,
+                record_count + len(records),
+                activity_time,
+            )
+            self._pending_values[event_id] = (
+                self._pending_values.get(event_id, 0) + counted_value
+            )
+            self._size += max(1, len(records))
+            should_flush = self._size >= self._flush_size and self.failures == 0
+        if should_flush:
+            self.flush()
+
+    def pending_value(self, event_id: int) -> int:
+        return self._pending_values.get(event_id, 0)
+
+    def run(self, sleep):
+        while True:
+            sleep(self.flush_time)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._size == 0:
+                return
+            records, self._records = self._records, []
+            lazy_records, self._lazy_records = self._lazy_records, {}
+            summaries, self._summaries = self._summaries, {}
+            size, self._size = self._size, 0
+        try:
+            with db.get_engine(self._app).begin() as connection:
+                if len(records) > 0:
+                    connection.execute(Record.__table__.insert(), records)
+                    RecordRollup.add(connection, records)
+                for event_id, value in lazy_records.items():
+                    connection.execute(
+                        Event.__table__.update()
+                        .where(Event.id == event_id)
+                        .values(lazy_records=Event.lazy_records + value)
+                    )
+                for event_id, (total, record_count, activity_time) in summaries.items():
+                    EventSummary.apply(
+                        connection, event_id, total, record_count, activity_time
+                    )
+        except Exception:
+            with self._lock:
+                self.failures += 1
+                self._requeue(records, lazy_records, summaries, size)
+            logger.exception(
+                f"Write-behind flush of {len(records)} records and "
+                f"{len(lazy_records)} lazy record updates failed "
+                f"{self.failures} times, requeueing"
+            )
+            return
+        with self._lock:
+            self.failures = 0
+            for event_id, (total, _, _) in summaries.items():
+                self._pending_values[event_id] -= total
+                if self._pending_values[event_id] == 0:
+                    del self._pending_values[event_id]
+
+    def _requeue(
+        self, records: list[dict], lazy_records: dict, summaries: dict, size: int
+    ):
+        self._records[:0] = records
+        for event_id, value in lazy_records.items():
+            self._lazy_records[event_id] = self._lazy_records.get(event_id, 0) + value
+        for event_id, (total, record_count, activity_time) in summaries.items():
+            queued = self._summaries.get(event_id)
+            if queued is not None:
+                total += queued[0]
+                record_count += queued[1]
+                activity_time = queued[2]
+            self._summaries[event_id] = (total, record_count, activity_time)
+        self._size += size
+
+
+class ArchiveJob:
+    def __init__(self):
+        self.interval = float(environ.get("ARCHIVE_INTERVAL", 0))
+        self.age = float(environ.get("ARCHIVE_AFTER_DAYS", 7)) * 24 * 60 * 60
+        self._stripe_age = float(environ.get("STRIPE_SESSION_MAX_AGE", 24 * 60 * 60))
+        self._app = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def init_app(self, app):
+        self._app = app
+
+    def run(self, sleep):
+        while True:
+            sleep(self.interval)
+            self.run_once(sleep)
+
+    def run_once(self, sleep=None):
+        with self._app.app_context():
+            try:
+                self.archive(sleep=sleep)
+            except Exception:
+                logger.exception("Archiving finished events failed")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def archive(self, age: float = None, sleep=None) -> tuple[int, int]:
+        write_behind_queue.flush()
+        if record_log_store.enabled:
+            record_log_job.compact()
+        cutoff = time_as_utc() - (self.age if age is None else age)
+        archived = select(RecordArchive.event)
+        event_ids = [
+            event_id
+            for (event_id,) in db.session.query(Event.id)
+            .filter(Event.is_premium == True)
+            .filter(Event.end_time != None)
+            .filter(Event.end_time <= cutoff)
+            .filter(Event.id.not_in(archived))
+        ]
+        for event_id in event_ids:
+            RecordArchive.archive_event(
+                Event.query.filter(Event.id == event_id).first()
+            )
+            if sleep is not None:
+                sleep(0)
+        pruned = StripeSession.query.filter(
+            or_(
+                StripeSession.used == True,
+                StripeSession.created < time_as_utc() - self._stripe_age,
+            )
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        with db.engine.connect() as connection:
+            if connection.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+                cursor = connection.connection.cursor()
+                cursor.executescript("PRAGMA incremental_vacuum")
+                cursor.close()
+        return len(event_ids), pruned
+
+    @staticmethod
+    def enable_incremental_vacuum() -> bool:
+        with db.engine.connect() as connection:
+            if connection.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+                return False
+            connection.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+            connection.execute(text("VACUUM"))
+        return True
+
+
+class RecordLogJob:
+    def __init__(self):
+        self.interval = float(environ.get("RECORD_LOG_COMPACT_INTERVAL", 5))
+        self._app = None
+
+    @property
+    def enabled(self) -> bool:
+        return record_log_store.enabled and self.interval > 0
+
+    def init_app(self, app):
+        self._app = app
+
+    def run(self, sleep):
+        while True:
+            sleep(self.interval)
+            self.run_once()
+
+    def run_once(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception("Compacting record logs failed")
+
+    def compact(self) -> int:
+        return sum(
+            self.compact_event(event_id) for event_id in record_log_store.event_ids()
+        )
+
+    def compact_event(self, event_id: int) -> int:
+        logs = record_log_store.logs(event_id)
+        if len(logs) == 0:
+            return 0
+        compacted = 0
+        with db.get_engine(self._app).begin() as connection:
+            event_row = connection.execute(
+                select(Event.start_time, Event.end_time).where(Event.id == event_id)
+            ).first()
+            if event_row is None:
+                record_log_store.remove(event_id)
+                return 0
+            positions = dict(
+                connection.execute(
+                    select(RecordLogOffset.log, RecordLogOffset.compacted).where(
+                        RecordLogOffset.event == event_id
+                    )
+                ).all()
+            )
+            for name, log in logs.items():
+                count, entries = log.rows(positions.get(name, 0))
+                if len(entries) == 0:
+                    continue
+                self._copy(connection, event_id, event_row, name, count, entries)
+                compacted += len(entries)
+        if event_row.end_time is not None and time_as_utc() >= event_row.end_time:
+            self._remove_finished(event_id)
+        return compacted
+
+    @staticmethod
+    def _copy(connection, event_id: int, event_row, name: str, count: int, entries):
+        start_time, end_time = event_row
+        rows = [
+            {"event": event_id, "time": record_time, "user": user_id, "value": value}
+            for record_time, user_id, value in entries
+        ]
+        connection.execute(
+            sqlite_insert(Record.__table__).on_conflict_do_nothing(), rows
+        )
+        RecordRollup.add(connection, rows)
+        if start_time is not None:
+            start_time = as_microseconds(start_time)
+            end_time = as_microseconds(end_time)
+        counted_value = sum(
+            value
+            for record_time, _, value in entries
+            if start_time is None or start_time <= record_time <= end_time
+        )
+        EventSummary.apply(
+            connection, event_id, counted_value, len(rows), entries[-1][0] / 1_000_000
+        )
+        statement = sqlite_insert(RecordLogOffset.__table__).values(
+            event=event_id, log=name, compacted=count
+        )
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=["event", "log"],
+                set_={
+                    "compacted": func.max(
+                        RecordLogOffset.__table__.c.compacted,
+                        statement.excluded.compacted,
+                    )
+                },
+            )
+        )
+
+    def _remove_finished(self, event_id: int):
+        with db.get_engine(self._app).begin() as connection:
+            positions = dict(
+                connection.execute(
+                    select(RecordLogOffset.log, RecordLogOffset.compacted).where(
+                        RecordLogOffset.event == event_id
+                    )
+                ).all()
+            )
+            for name, log in record_log_store.logs(event_id).items():
+                if log.rows(positions.get(name, 0))[0] != positions.get(name, 0):
+                    return
+            record_log_store.remove(event_id)
+            connection.execute(
+                RecordLogOffset.__table__.delete().where(
+                    RecordLogOffset.event == event_id
+                )
+            )
+
+
+record_clock = RecordClock()
+write_behind_queue = WriteBehindQueue()
+archive_job = ArchiveJob()
+record_log_job = RecordLogJob()
+
+
+def init_db():
+    db.create_all()
+    migrated = migrate_record_layout()
+    if migrated > 0:
+        logger.warning(f"Migrated {migrated} records to the compact layout")
+    EventSummary.backfill()
+    archive_job.enable_incremental_vacuum()
+    torn_size = record_log_store.recover()
+    if torn_size > 0:
+        logger.warning(f"Truncated {torn_size} bytes of torn record log entries")
+
+
+def migrate_record_layout() -> int:
+    with db.engine.begin() as connection:
+        migrated = Record.migrate_layout(connection)
+    if migrated > 0:
+        with db.engine.connect() as connection:
+            connection.execute(text("VACUUM"))
+    return migrated
+
+
 @event.listens_for(Engine, "connect")
 def set_journal_mode(*args):
-    cursor = args[0].cursor()
-    cursor.execute("PRAGMA journal_mode = MEMORY")
-    cursor.close()
+    storage_profile.apply(args[0])
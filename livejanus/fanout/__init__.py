@@ -0,0 +1,134 @@
+from os import environ
+from pickle import dumps
+from socketserver import BaseRequestHandler, ThreadingTCPServer
+from struct import Struct
+from threading import Lock
+from urllib.parse import urlparse
+
+import socketio
+
+frame_header = Struct("!I")
+publisher_role = b"P"
+subscriber_role = b"S"
+
+
+def read_frame(connection) -> bytes:
+    header = read_exactly(connection, frame_header.size)
+    return read_exactly(connection, frame_header.unpack(header)[0])
+
+
+def read_exactly(connection, length: int) -> bytes:
+    data = b""
+    while len(data) < length:
+        chunk = connection.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("The loopback connection was closed")
+        data += chunk
+    return data
+
+
+class LoopbackBroker(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str, port: int):
+        self._connections = set()
+        self._lock = Lock()
+        super().__init__((host, port), LoopbackBrokerConnection)
+
+    def subscribe(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+
+    def unsubscribe(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+
+    def publish(self, frame: bytes):
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.sendall(frame)
+            except OSError:
+                self.unsubscribe(connection)
+
+
+class LoopbackBrokerConnection(BaseRequestHandler):
+    def handle(self):
+        try:
+            role = read_exactly(self.request, 1)
+            if role == subscriber_role:
+                self.server.subscribe(self.request)
+                read_exactly(self.request, 1)
+            while True:
+                message = read_frame(self.request)
+                self.server.publish(frame_header.pack(len(message)) + message)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.server.unsubscribe(self.request)
+
+
+class LoopbackManager(socketio.PubSubManager):
+    name = "loopback"
+
+    def __init__(self, url: str, channel: str = "livejanus", write_only=False):
+        parsed_url = urlparse(url)
+        self._address = (parsed_url.hostname, parsed_url.port)
+        self._connection = None
+        self._lock = Lock()
+        self._socket = None
+        super().__init__(channel=channel, write_only=write_only)
+
+    def initialize(self):
+        if self.server.async_mode == "eventlet":
+            from eventlet.green import socket
+            from eventlet.semaphore import Semaphore
+
+            self._lock = Semaphore()
+        else:
+            import socket
+        self._socket = socket
+        super().initialize()
+
+    def _connect(self, role: bytes):
+        socket = self._socket
+        connection = socket.create_connection(self._address)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection.sendall(role)
+        return connection
+
+    def _publish(self, data):
+        message = dumps(data)
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._connect(publisher_role)
+            try:
+                self._connection.sendall(frame_header.pack(len(message)) + message)
+            except OSError:
+                self._connection = None
+                raise
+
+    def _listen(self):
+        while True:
+            try:
+                connection = self._connect(subscriber_role)
+                while True:
+                    yield read_frame(connection)
+            except (ConnectionError, OSError):
+                self._get_logger().error(
+                    "Loopback broker connection lost, retrying in 1 second"
+                )
+                self.server.sleep(1)
+
+
+def create_client_manager():
+    url = environ.get("SOCKETIO_MESSAGE_QUEUE")
+    if not url:
+        return None
+    if url.startswith("loopback://"):
+        return LoopbackManager(url)
+    if url.startswith(("redis://", "rediss://")):
+        return socketio.RedisManager(url, channel="livejanus")
+    return socketio.KombuManager(url, channel="livejanus")
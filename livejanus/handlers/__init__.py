@@ -0,0 +1,207 @@
+from typing import Union
+
+from livejanus.auth import (
+    auth_handler,
+    socket_session_handler,
+    update_sequence_handler,
+)
+from livejanus.db import Event, EventSummary, EventUser, write_behind_queue
+from livejanus.limit import update_limiter
+from livejanus.live import (
+    WireDictionary,
+    broadcast_scheduler,
+    enforce_max_value,
+    live_event_state_handler,
+    live_feed_handler,
+    room_presence_handler,
+    update_batch_max,
+    wire_dictionary_handler,
+    wire_formats,
+)
+from livejanus.metrics import metrics
+from livejanus.util import SocketInvalidDataException, time_as_utc
+
+
+@metrics.timed("livejanus_socket_join_seconds")
+def handle_join(transport, session_id: str, data):
+    try:
+        token, last_sequence, wire_format = parse_join(data)
+        event_user: EventUser = auth_handler.validate(token)
+        if event_user is None:
+            raise SocketInvalidDataException("The session cookie was invalid")
+        event_state = live_event_state_handler.fetch(event_user.event, Event)
+        if event_state is None:
+            raise SocketInvalidDataException("The event was not found")
+        if live_event_state_handler.shared:
+            current = EventSummary.current_for(event_state.event_id)
+            if current is not None:
+                event_state.set_total(current[0])
+                live_feed_handler.advance(event_state.key, current[1])
+        socket_session_handler.save(
+            session_id,
+            event_user.username,
+            event_user.id,
+            event_state.key,
+            event_state.event_id,
+        )
+        transport.join_room(
+            session_id, wire_dictionary_handler.room(event_state.key, wire_format)
+        )
+        room_presence_handler.join(event_state.key, session_id, event_user.username)
+        if type(data) != dict:
+            transport.emit("join", event_state.total, session_id)
+            return
+        sequence, records, reset = live_feed_handler.replay(
+            event_state.key, last_sequence
+        )
+        reply = {
+            "total": event_state.total,
+            "seq": sequence,
+            "records": records,
+            "reset": reset,
+        }
+        if wire_format == "compact":
+            dictionary = fetch_wire_dictionary(
+                transport, event_state, event_user.username
+            )
+            reply["records"] = [dictionary.encode(record) for record in records]
+            reply["format"] = wire_format
+            reply["epoch"] = dictionary.epoch
+            reply["users"] = dictionary.usernames
+        transport.emit("join", reply, session_id)
+    except Exception:
+        transport.emit("join", False, session_id)
+
+
+def join_event_id(data) -> Union[None, int]:
+    try:
+        token, _, _ = parse_join(data)
+    except SocketInvalidDataException:
+        return None
+    event_user = auth_handler.validate(token)
+    return None if event_user is None else event_user.event
+
+
+def parse_join(data) -> tuple[str, Union[None, int], str]:
+    if type(data) == str:
+        return data, None, "legacy"
+    if type(data) != dict:
+        raise SocketInvalidDataException("The join request was invalid")
+    token, sequence = data.get("token"), data.get("seq")
+    wire_format = data.get("format", "json")
+    if type(token) != str:
+        raise SocketInvalidDataException("The session cookie was invalid")
+    if sequence is not None and (type(sequence) != int or sequence < 0):
+        raise SocketInvalidDataException(f'Sequence number "{sequence}" was invalid')
+    if wire_format not in wire_formats:
+        raise SocketInvalidDataException(f'Wire format "{wire_format}" was invalid')
+    return token, sequence, wire_format
+
+
+def fetch_wire_dictionary(transport, event_state, username: str) -> WireDictionary:
+    dictionary = wire_dictionary_handler.get(event_state.key)
+    if dictionary is not None and username in dictionary:
+        return dictionary
+    known_count = 0 if dictionary is None else len(dictionary.usernames)
+    dictionary = wire_dictionary_handler.load(
+        event_state.key,
+        event_state.epoch,
+        EventUser.usernames_for(event_state.event_id),
+    )
+    if known_count > 0:
+        transport.emit(
+            "users",
+            {"start": known_count, "users": dictionary.usernames[known_count:]},
+            wire_dictionary_handler.room(event_state.key, "compact"),
+        )
+    return dictionary
+
+
+def handle_disconnect(session_id: str):
+    socket_session_handler.delete(session_id)
+    room_presence_handler.leave(session_id)
+    update_limiter.forget(session_id)
+
+
+@metrics.timed("livejanus_socket_update_seconds")
+def handle_update(transport, session_id: str, data):
+    try:
+        retry_time = update_limiter.check_load(len(write_behind_queue))
+        if retry_time is None:
+            retry_time = update_limiter.check_connection(session_id)
+        if retry_time is not None:
+            return limit_update(transport, session_id, data, retry_time)
+        session_data = socket_session_handler.fetch(session_id)
+        if session_data is None:
+            raise SocketInvalidDataException("The session ID was not found")
+        event_user_name, event_user_id, event_key, event_id = session_data
+        retry_time = update_limiter.check_user(event_user_id)
+        if retry_time is not None:
+            return limit_update(transport, session_id, data, retry_time)
+        client_id, sequence, count = parse_update(data)
+        event_state = live_event_state_handler.fetch(event_id, Event)
+        if event_state is None:
+            raise SocketInvalidDataException("The event was not found")
+        if client_id is not None and update_sequence_handler.is_duplicate(
+            event_user_id, client_id, sequence
+        ):
+            return {"seq": sequence, "total": event_state.total}
+        if not event_state.is_happening:
+            raise SocketInvalidDataException("The event has ended")
+
+        event = Event.query.filter(Event.id == event_id).first()
+        total_value, summary_sequence = event.add_record(
+            event_user_id, count, enforce_max=enforce_max_value
+        )
+        if client_id is not None:
+            update_sequence_handler.accept(event_user_id, client_id, sequence)
+        entry = live_feed_handler.append(
+            event_key,
+            [time_as_utc(), event_user_name, total_value, count],
+            summary_sequence if live_event_state_handler.shared else None,
+        )
+        dictionary = wire_dictionary_handler.get(event_key)
+        if dictionary is not None or wire_dictionary_handler.shared:
+            dictionary = fetch_wire_dictionary(transport, event_state, event_user_name)
+        if broadcast_scheduler.enabled:
+            broadcast_scheduler.add(event_key, entry)
+        else:
+            transport.emit("update", entry, event_key)
+            transport.emit(
+                "update", entry[:4], wire_dictionary_handler.room(event_key, "legacy")
+            )
+            if dictionary is not None:
+                transport.emit(
+                    "update",
+                    dictionary.encode(entry),
+                    wire_dictionary_handler.room(event_key, "compact"),
+                )
+        metrics.increment("livejanus_socket_updates_total")
+        return {"seq": sequence, "total": total_value}
+    except Exception:
+        metrics.increment("livejanus_socket_update_errors_total")
+        if type(data) != dict:
+            transport.emit("update", False, session_id)
+        return False
+
+
+def limit_update(transport, session_id: str, data, retry_time: float):
+    if type(data) != dict:
+        transport.emit("update", False, session_id)
+        return False
+    return {"retry": round(retry_time, 3)}
+
+
+def parse_update(data) -> tuple[Union[None, str], Union[None, int], int]:
+    if data in [1, -1] and type(data) == int:
+        return None, None, data
+    if type(data) != dict:
+        raise SocketInvalidDataException(f'Update value "{data}" was invalid')
+    client_id, sequence, count = data.get("client"), data.get("seq"), data.get("count")
+    if type(client_id) != str or not 0 < len(client_id) <= 64:
+        raise SocketInvalidDataException(f'Client ID "{client_id}" was invalid')
+    if type(sequence) != int or sequence < 0:
+        raise SocketInvalidDataException(f'Sequence number "{sequence}" was invalid')
+    if type(count) != int or count == 0 or abs(count) > update_batch_max:
+        raise SocketInvalidDataException(f'Update count "{count}" was invalid')
+    return client_id, sequence, count
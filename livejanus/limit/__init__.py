@@ -0,0 +1,103 @@
+from collections import OrderedDict
+from os import environ
+from time import monotonic, perf_counter
+from typing import Union
+
+from sqlalchemy import event as sqlalchemy_event
+from sqlalchemy.orm import Session
+
+from livejanus.metrics import metrics
+
+
+class TokenBuckets:
+    def __init__(self, rate: float, burst: float, max_size: int = 65536):
+        self.rate = rate
+        self.burst = burst
+        self._max_size = max_size
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, now: float) -> Union[None, float]:
+        tokens, last_time = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last_time) * self.rate)
+        retry_time = None
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_time = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self._max_size:
+            self._buckets.popitem(last=False)
+        return retry_time
+
+    def discard(self, key):
+        self._buckets.pop(key, None)
+
+
+class UpdateLimiter:
+    def __init__(self):
+        rate = float(environ.get("UPDATE_RATE_LIMIT", 10))
+        burst = float(environ.get("UPDATE_BURST", 20))
+        self.enabled = rate > 0
+        self._connections = TokenBuckets(rate, burst)
+        self._users = TokenBuckets(rate, burst)
+        self._shed_queue_size = int(environ.get("LOAD_SHED_QUEUE_SIZE", 0))
+        self._shed_commit_time = float(environ.get("LOAD_SHED_COMMIT_TIME", 0))
+        self._shed_retry_time = float(environ.get("LOAD_SHED_RETRY_TIME", 1))
+        self._commit_latency = 0
+        self._commit_observed = 0
+
+    def init_app(self, app):
+        if self._shed_commit_time <= 0:
+            return
+        sqlalchemy_event.listen(Session, "before_commit", self._before_commit)
+        sqlalchemy_event.listen(Session, "after_commit", self._after_commit)
+
+    def check_load(self, queue_size: int) -> Union[None, float]:
+        if 0 < self._shed_queue_size <= queue_size or self._is_committing_slowly():
+            metrics.increment("livejanus_socket_updates_shed_total")
+            return self._shed_retry_time
+        return None
+
+    def check_connection(self, session_id: str) -> Union[None, float]:
+        if not self.enabled:
+            return None
+        retry_time = self._connections.take(session_id, monotonic())
+        if retry_time is not None:
+            metrics.increment("livejanus_socket_updates_limited_total")
+        return retry_time
+
+    def check_user(self, event_user_id: int) -> Union[None, float]:
+        if not self.enabled:
+            return None
+        retry_time = self._users.take(event_user_id, monotonic())
+        if retry_time is not None:
+            metrics.increment("livejanus_socket_updates_limited_total")
+        return retry_time
+
+    def forget(self, session_id: str):
+        self._connections.discard(session_id)
+
+    def _is_committing_slowly(self) -> bool:
+        if self._shed_commit_time <= 0:
+            return False
+        if monotonic() - self._commit_observed > self._shed_retry_time:
+            return False
+        return self._commit_latency > self._shed_commit_time
+
+    @staticmethod
+    def _before_commit(session):
+        session.info["limit_commit_start_time"] = perf_counter()
+
+    def _after_commit(self, session):
+        start_time = session.info.pop("limit_commit_start_time", None)
+        if start_time is None:
+            return
+        latency = perf_counter() - start_time
+        self._commit_latency = 0.8 * self._commit_latency + 0.2 * latency
+        self._commit_observed = monotonic()
+
+
+update_limiter = UpdateLimiter()
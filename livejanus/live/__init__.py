@@ -0,0 +1,280 @@
+from collections import deque
+from os import environ
+from threading import Lock
+from time import time
+from typing import Union
+
+from livejanus.util import time_as_utc
+
+update_batch_max = int(environ.get("UPDATE_BATCH_MAX", 50))
+enforce_max_value = environ.get("ENFORCE_MAX_VALUE", "false").lower() == "true"
+wire_formats = ["json", "compact"]
+
+
+class LiveEventState:
+    def __init__(self, event):
+        self.event_id = event.id
+        self.key = event.key
+        self.is_premium = event.is_premium
+        self.lazy_records = event.lazy_records
+        self.start_time = event.start_time
+        self.end_time = event.end_time
+        self.max_value = event.max_value
+        self.epoch = int(event.created_time)
+        self.total = event.query_total_value()
+        self.reconciled = time()
+
+    @property
+    def is_happening(self) -> bool:
+        if not self.is_premium:
+            return True
+        if self.end_time is None:
+            return True
+        return self.start_time <= time_as_utc() <= self.end_time
+
+    def add(self, value: int, record_time: float = None) -> int:
+        if not self.is_premium:
+            self.lazy_records += value
+            self.total += value
+            return self.total
+        if self.start_time is not None:
+            if record_time is None:
+                record_time = time_as_utc()
+            if not self.start_time <= record_time <= self.end_time:
+                return self.total
+        self.total += value
+        return self.total
+
+    def set_total(self, total: int, lazy_records: int = None) -> int:
+        if lazy_records is not None:
+            self.lazy_records = lazy_records
+        self.total = total
+        return self.total
+
+
+class LiveEventStateHandler:
+    def __init__(self):
+        self.shared = False
+        self._states = {}
+        self._reconcile_time = float(environ.get("LIVE_STATE_RECONCILE_TIME", 60))
+
+    def fetch(self, event_id: int, query_class: type) -> Union[None, LiveEventState]:
+        state = self._states.get(event_id)
+        if state is not None and not self._is_stale(state):
+            return state
+        event = (
+            query_class.query.filter(query_class.id == event_id)
+            .populate_existing()
+            .first()
+        )
+        if event is None:
+            self.discard(event_id)
+            return None
+        return self.load(event)
+
+    def fetch_event(self, event) -> LiveEventState:
+        return self.fetch(event.id, type(event))
+
+    def load(self, event) -> LiveEventState:
+        state = LiveEventState(event)
+        self._states[event.id] = state
+        return state
+
+    def discard(self, event_id: int):
+        self._states.pop(event_id, None)
+
+    def _is_stale(self, state: LiveEventState) -> bool:
+        return time() - state.reconciled > self._reconcile_time
+
+
+class RoomPresenceHandler:
+    def __init__(self):
+        self._rooms = {}
+        self._session_rooms = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._session_rooms)
+
+    @property
+    def room_count(self) -> int:
+        return len(self._rooms)
+
+    def join(self, event_key: str, session_id: str, event_user_name: str):
+        with self._lock:
+            self._leave(session_id)
+            self._rooms.setdefault(event_key, {})[session_id] = event_user_name
+            self._session_rooms[session_id] = event_key
+
+    def leave(self, session_id: str) -> Union[None, str]:
+        with self._lock:
+            return self._leave(session_id)
+
+    def _leave(self, session_id: str) -> Union[None, str]:
+        event_key = self._session_rooms.pop(session_id, None)
+        if event_key is None:
+            return None
+        room = self._rooms[event_key]
+        del room[session_id]
+        if len(room) == 0:
+            del self._rooms[event_key]
+        return event_key
+
+    def count(self, event_key: str) -> int:
+        return len(self._rooms.get(event_key, ()))
+
+    def usernames(self, event_key: str) -> set[str]:
+        return set(self._rooms.get(event_key, {}).values())
+
+
+class LiveFeed:
+    def __init__(self, size: int):
+        self.sequence = 0
+        self.entries = deque(maxlen=size)
+
+    def append(self, entry: list, sequence: int = None) -> list:
+        if sequence is None:
+            sequence = self.sequence + 1
+        self.advance(sequence)
+        entry = entry + [sequence]
+        self.entries.append(entry)
+        return entry
+
+    def advance(self, sequence: int):
+        self.sequence = max(self.sequence, sequence)
+
+    def since(self, sequence: int) -> Union[None, list]:
+        if sequence > self.sequence:
+            return None
+        entries = [entry for entry in self.entries if entry[4] > sequence]
+        if [entry[4] for entry in entries] != list(
+            range(sequence + 1, self.sequence + 1)
+        ):
+            return None
+        return entries
+
+
+class LiveFeedHandler:
+    def __init__(self):
+        self._feeds = {}
+        self._size = int(environ.get("LIVE_FEED_SIZE", 100))
+        self._replay_count = int(environ.get("LIVE_FEED_REPLAY", 20))
+
+    def append(self, event_key: str, entry: list, sequence: int = None) -> list:
+        return self._feed(event_key).append(entry, sequence)
+
+    def advance(self, event_key: str, sequence: int):
+        self._feed(event_key).advance(sequence)
+
+    def replay(
+        self, event_key: str, sequence: Union[None, int]
+    ) -> tuple[int, list, bool]:
+        feed = self._feeds.get(event_key)
+        if feed is None:
+            return 0, [], sequence is not None and sequence > 0
+        if sequence is not None:
+            entries = feed.since(sequence)
+            if entries is not None:
+                return feed.sequence, entries, False
+        latest = list(feed.entries)[-self._replay_count :]
+        return feed.sequence, latest, sequence is not None
+
+    def _feed(self, event_key: str) -> LiveFeed:
+        feed = self._feeds.get(event_key)
+        if feed is None:
+            feed = self._feeds[event_key] = LiveFeed(self._size)
+        return feed
+
+
+class WireDictionary:
+    def __init__(self, epoch: int, usernames: list[str]):
+        self.epoch = epoch
+        self.usernames = usernames
+        self._indexes = {username: index for index, username in enumerate(usernames)}
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._indexes
+
+    def encode(self, entry: list) -> list:
+        record_time, username, total, count, sequence = entry
+        return [
+            round((record_time - self.epoch) * 1000),
+            self._indexes.get(username, -1),
+            total,
+            count,
+            sequence,
+        ]
+
+
+class WireDictionaryHandler:
+    def __init__(self):
+        self.shared = False
+        self._dictionaries = {}
+
+    @staticmethod
+    def room(event_key: str, wire_format: str) -> str:
+        if wire_format == "json":
+            return event_key
+        return f"{event_key}/{wire_format}"
+
+    def get(self, event_key: str) -> Union[None, WireDictionary]:
+        return self._dictionaries.get(event_key)
+
+    def load(self, event_key: str, epoch: int, usernames: list[str]) -> WireDictionary:
+        dictionary = self._dictionaries[event_key] = WireDictionary(epoch, usernames)
+        return dictionary
+
+
+class BroadcastScheduler:
+    def __init__(self):
+        self.tick = float(environ.get("BROADCAST_TICK", 0))
+        self._pending = {}
+        self._socketio = None
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.tick > 0
+
+    def start(self, socketio):
+        self.attach(socketio)
+        if self.enabled:
+            socketio.start_background_task(self.run)
+
+    def attach(self, socketio):
+        self._socketio = socketio
+
+    def add(self, event_key: str, entry: list):
+        with self._lock:
+            self._pending.setdefault(event_key, []).append(entry)
+
+    def run(self):
+        while True:
+            self._socketio.sleep(self.tick)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for event_key, entries in pending.items():
+            self._socketio.emit("updates", [entries[-1][2], entries], room=event_key)
+            for entry in entries:
+                self._socketio.emit(
+                    "update",
+                    entry[:4],
+                    room=wire_dictionary_handler.room(event_key, "legacy"),
+                )
+            dictionary = wire_dictionary_handler.get(event_key)
+            if dictionary is not None:
+                self._socketio.emit(
+                    "updates",
+                    [entries[-1][2], [dictionary.encode(entry) for entry in entries]],
+                    room=wire_dictionary_handler.room(event_key, "compact"),
+                )
+
+
+live_event_state_handler = LiveEventStateHandler()
+room_presence_handler = RoomPresenceHandler()
+live_feed_handler = LiveFeedHandler()
+wire_dictionary_handler = WireDictionaryHandler()
+broadcast_scheduler = BroadcastScheduler()
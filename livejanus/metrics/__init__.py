@@ -0,0 +1,159 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from ipaddress import ip_address, ip_network
+from os import environ
+from time import perf_counter
+
+from jinja2 import Template
+from sqlalchemy import event as sqlalchemy_event
+from sqlalchemy.orm import Session
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bucket}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = environ.get("METRICS", "false").lower() == "true"
+        self._allowlist = [
+            ip_network(network.strip())
+            for network in environ.get("METRICS_ALLOWLIST", "127.0.0.1,::1").split(",")
+            if network.strip() != ""
+        ]
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        app.jinja_env.template_class = TimedTemplate
+        sqlalchemy_event.listen(Session, "before_commit", self._before_commit)
+        sqlalchemy_event.listen(Session, "after_commit", self._after_commit)
+        sqlalchemy_event.listen(Session, "after_rollback", self._after_rollback)
+
+    def increment(self, name: str, value: int = 1):
+        if self.enabled:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        if not self.enabled:
+            return
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name: str, callback):
+        self._gauges[name] = callback
+
+    def timed(self, name: str):
+        def decorator(function):
+            if not self.enabled:
+                return function
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                start_time = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, perf_counter() - start_time)
+
+            return wrapper
+
+        return decorator
+
+    @contextmanager
+    def timer(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start_time)
+
+    def is_allowed(self, address: str) -> bool:
+        if not self.enabled or address is None:
+            return False
+        try:
+            address = ip_address(address)
+        except ValueError:
+            return False
+        return any(address in network for network in self._allowlist)
+
+    def render(self) -> str:
+        lines = []
+        for name, value in sorted(self._counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        for name, histogram in sorted(self._histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(histogram.render(name))
+        for name, callback in sorted(self._gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {callback()}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _before_commit(session):
+        session.info["commit_start_time"] = perf_counter()
+
+    def _after_commit(self, session):
+        start_time = session.info.pop("commit_start_time", None)
+        if start_time is not None:
+            self.observe("livejanus_db_commit_seconds", perf_counter() - start_time)
+
+    def _after_rollback(self, session):
+        if session.info.pop("commit_start_time", None) is not None:
+            self.increment("livejanus_db_commit_failures_total")
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        with metrics.timer("livejanus_template_render_seconds"):
+            return super().render(*args, **kwargs)
+
+
+metrics = Metrics()
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from mmap import ACCESS_READ, mmap
+from os import (
+    O_APPEND,
+    O_CREAT,
+    O_RDONLY,
+    O_WRONLY,
+    close,
+    environ,
+    fstat,
+    ftruncate,
+    getpid,
+    listdir,
+    makedirs,
+    open as os_open,
+    remove,
+    rmdir,
+    write,
+)
+from os.path import isdir, join as pjoin
+from struct import Struct
+from threading import Lock
+
+log_entry = Struct("<qihxx")
+log_suffix = ".log"
+
+
+class RecordLog:
+    def __init__(self, path: str):
+        self.path = path
+
+    def sum_range(
+        self, start_index: int, start_time: int = None, end_time: int = None
+    ) -> int:
+        return self._read(self._sum_range, start_index, start_time, end_time)
+
+    def rows(self, start_index: int) -> tuple[int, list[tuple[int, int, int]]]:
+        return self._read(self._rows, start_index)
+
+    def recover(self) -> int:
+        file_descriptor = os_open(self.path, O_WRONLY)
+        try:
+            size = fstat(file_descriptor).st_size
+            torn_size = size % log_entry.size
+            if torn_size > 0:
+                ftruncate(file_descriptor, size - torn_size)
+            return torn_size
+        finally:
+            close(file_descriptor)
+
+    def _read(self, function, *args):
+        file_descriptor = os_open(self.path, O_RDONLY)
+        try:
+            count = fstat(file_descriptor).st_size // log_entry.size
+            if count == 0:
+                return function(memoryview(b""), 0, *args)
+            with mmap(
+                file_descriptor, count * log_entry.size, access=ACCESS_READ
+            ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    return function(view, count, *args)
+                finally:
+                    view.release()
+        finally:
+            close(file_descriptor)
+
+    @staticmethod
+    def _sum_range(view, count: int, start_index: int, start_time, end_time) -> int:
+        if start_index >= count:
+            return 0
+        with view.cast("q") as times, view.cast("h") as values:
+            low = start_index
+            high = count
+            if start_time is not None:
+                low = RecordLog._search(times, low, high, start_time, False)
+                high = RecordLog._search(times, low, high, end_time, True)
+            if low >= high:
+                return 0
+            with values[low * 8 + 6 : high * 8 : 8] as column:
+                return sum(column)
+
+    @staticmethod
+    def _search(times, low: int, high: int, record_time: int, after: bool) -> int:
+        while low < high:
+            middle = (low + high) // 2
+            middle_time = times[middle * 2]
+            if middle_time < record_time or (after and middle_time == record_time):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    @staticmethod
+    def _rows(view, count: int, start_index: int) -> tuple[int, list]:
+        if start_index >= count:
+            return count, []
+        with view[start_index * log_entry.size :] as entries:
+            return count, list(log_entry.iter_unpack(entries))
+
+
+class RecordLogStore:
+    def __init__(self):
+        self.enabled = environ.get("RECORD_STORAGE", "table").lower() == "log"
+        self.directory = environ.get("RECORD_LOG_PATH", "data/records")
+        self._max_writers = int(environ.get("RECORD_LOG_MAX_OPEN", 256))
+        self._writers = OrderedDict()
+        self._lock = Lock()
+
+    def append(self, event_id: int, user_id: int, first_time: int, value: int):
+        step = 1 if value > 0 else -1
+        entries = b"".join(
+            log_entry.pack(first_time + index, user_id, step)
+            for index in range(abs(value))
+        )
+        with self._lock:
+            file_descriptor = self._writer(event_id)
+            written = write(file_descriptor, entries)
+            if written != len(entries):
+                ftruncate(file_descriptor, fstat(file_descriptor).st_size - written)
+                raise OSError(f"Short write of {written} bytes to the record log")
+
+    def logs(self, event_id: int) -> dict[str, RecordLog]:
+        event_directory = pjoin(self.directory, str(event_id))
+        if not isdir(event_directory):
+            return {}
+        return {
+            name: RecordLog(pjoin(event_directory, name))
+            for name in listdir(event_directory)
+            if name.endswith(log_suffix)
+        }
+
+    def event_ids(self) -> list[int]:
+        if not isdir(self.directory):
+            return []
+        return [int(name) for name in listdir(self.directory) if name.isdigit()]
+
+    def remove(self, event_id: int):
+        with self._lock:
+            file_descriptor = self._writers.pop(event_id, None)
+        if file_descriptor is not None:
+            close(file_descriptor)
+        for log in self.logs(event_id).values():
+            remove(log.path)
+        event_directory = pjoin(self.directory, str(event_id))
+        if isdir(event_directory):
+            rmdir(event_directory)
+
+    def recover(self) -> int:
+        return sum(
+            log.recover()
+            for event_id in self.event_ids()
+            for log in self.logs(event_id).values()
+        )
+
+    def _writer(self, event_id: int) -> int:
+        file_descriptor = self._writers.get(event_id)
+        if file_descriptor is not None:
+            self._writers.move_to_end(event_id)
+            return file_descriptor
+        event_directory = pjoin(self.directory, str(event_id))
+        makedirs(event_directory, exist_ok=True)
+        log = RecordLog(pjoin(event_directory, f"{getpid()}{log_suffix}"))
+        file_descriptor = os_open(log.path, O_WRONLY | O_APPEND | O_CREAT, 0o644)
+        log.recover()
+        self._writers[event_id] = file_descriptor
+        while len(self._writers) > self._max_writers:
+            close(self._writers.popitem(last=False)[1])
+        return file_descriptor
+
+
+record_log_store = RecordLogStore()
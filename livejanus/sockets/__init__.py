@@ -0,0 +1,73 @@
+from flask import request
+from flask_socketio import SocketIO, join_room
+
+from livejanus.db import archive_job, record_log_job, write_behind_queue
+from livejanus.recordlog import record_log_store
+from livejanus.fanout import create_client_manager
+from livejanus.handlers import handle_disconnect, handle_join, handle_update
+from livejanus.limit import update_limiter
+from livejanus.live import (
+    broadcast_scheduler,
+    live_event_state_handler,
+    wire_dictionary_handler,
+)
+
+livejanus_socketio = SocketIO()
+
+
+class FlaskSocketTransport:
+    def __init__(self, socketio: SocketIO):
+        self._socketio = socketio
+
+    def emit(self, event: str, data, room: str):
+        self._socketio.emit(event, data, room=room)
+
+    @staticmethod
+    def join_room(session_id: str, room: str):
+        join_room(room, sid=session_id)
+
+
+flask_socket_transport = FlaskSocketTransport(livejanus_socketio)
+
+
+def init_app(app):
+    client_manager = create_client_manager()
+    if client_manager is not None and (
+        write_behind_queue.enabled or record_log_store.enabled
+    ):
+        raise ValueError(
+            "WRITE_BEHIND and RECORD_STORAGE=log keep totals in one process, "
+            "and cannot be used with a message queue"
+        )
+    livejanus_socketio.init_app(app, client_manager=client_manager)
+    live_event_state_handler.shared = client_manager is not None
+    wire_dictionary_handler.shared = client_manager is not None
+    update_limiter.init_app(app)
+    broadcast_scheduler.start(livejanus_socketio)
+    if write_behind_queue.enabled:
+        livejanus_socketio.start_background_task(
+            write_behind_queue.run, livejanus_socketio.sleep
+        )
+    if archive_job.enabled:
+        livejanus_socketio.start_background_task(
+            archive_job.run, livejanus_socketio.sleep
+        )
+    if record_log_job.enabled:
+        livejanus_socketio.start_background_task(
+            record_log_job.run, livejanus_socketio.sleep
+        )
+
+
+@livejanus_socketio.on("join")
+def socket_join(data):
+    handle_join(flask_socket_transport, request.sid, data)
+
+
+@livejanus_socketio.on("disconnect")
+def socket_disconnect():
+    handle_disconnect(request.sid)
+
+
+@livejanus_socketio.on("update")
+def socket_update(data):
+    return handle_update(flask_socket_transport, request.sid, data)
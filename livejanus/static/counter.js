@@ -5,10 +5,58 @@ try {
   alert("The WebSocket connection failed");
 }
 
+const clientId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+const batchWindow = 150;
+let joined = false;
+let lastSeq = null;
+const seenSeqs = new Set();
+const seenSeqLimit = 256;
+let nextSeq = 1;
+let pendingCount = 0;
+let inFlight = null;
+let flushTimer = null;
+let wire = null;
+
 function sendUpdate(value) {
   if (value !== 1 && value !== -1) return;
+  pendingCount += value;
+  if (Math.abs(pendingCount) >= batchMax) {
+    flushUpdates();
+  } else if (flushTimer === null) {
+    flushTimer = setTimeout(flushUpdates, batchWindow);
+  }
+}
+
+function flushUpdates() {
+  clearTimeout(flushTimer);
+  flushTimer = null;
+  if (!joined || inFlight !== null || pendingCount === 0) return;
+  let count = Math.max(-batchMax, Math.min(batchMax, pendingCount));
+  pendingCount -= count;
+  inFlight = { client: clientId, seq: nextSeq++, count: count };
+  emitInFlight();
+}
+
+function emitInFlight() {
+  let batch = inFlight;
   try {
-    socket.emit("update", value);
+    socket.emit("update", batch, (ack) => {
+      if (inFlight !== batch) return;
+      if (ack && ack.retry !== undefined) {
+        pendingCount += batch.count;
+        inFlight = null;
+        clearTimeout(flushTimer);
+        flushTimer = setTimeout(flushUpdates, ack.retry * 1000);
+        return;
+      }
+      if (ack === false) {
+        alert(
+          "An error occurred, and the most recent record was not recorded."
+        );
+      }
+      inFlight = null;
+      flushUpdates();
+    });
   } catch (e) {
     console.log(e);
     alert("An error occurred, and the value was not updated.");
@@ -20,12 +68,53 @@ function receiveUpdate(data) {
     alert("An error occurred, and the most recent record was not recorded.");
     return;
   }
-  if (data.length !== 4) {
+  if (data.length !== 4 && data.length !== 5) {
     alert("Invalid data was received while updating.");
     return;
   }
-  updateCount(data[2]);
-  addRecord(data[0], data[1], data[2], data[3], data[4]);
+  if (receiveRecord(data)) updateCount(data[2]);
+}
+
+function receiveUpdates(data) {
+  if (data.length !== 2) {
+    alert("Invalid data was received while updating.");
+    return;
+  }
+  let [total, records] = data;
+  if (records.filter(receiveRecord).length > 0) updateCount(total);
+}
+
+function receiveUsers(data) {
+  if (wire === null) return;
+  wire.users.splice(data.start, data.users.length, ...data.users);
+}
+
+function decodeRecord(record) {
+  if (wire === null) return record;
+  let [offset, userIndex, total, count, seq] = record;
+  let username = wire.users[userIndex] ?? "";
+  return [wire.epoch + offset / 1000, username, total, count, seq];
+}
+
+function receiveRecord(record) {
+  record = decodeRecord(record);
+  let seq = record[4];
+  let advanced = true;
+  if (seq !== undefined) {
+    if (seenSeqs.has(seq)) return false;
+    seenSeqs.add(seq);
+    if (seenSeqs.size > seenSeqLimit) {
+      seenSeqs.delete(seenSeqs.values().next().value);
+    }
+    advanced = lastSeq === null || seq > lastSeq;
+    if (advanced) lastSeq = seq;
+  }
+  addRecord(record[0], record[1], record[2], record[3]);
+  return advanced;
+}
+
+function clearRecords() {
+  document.getElementById("records").replaceChildren();
 }
 
 function addRecord(recordTime, recordUser, recordValue, recordChange) {
@@ -85,13 +174,36 @@ function updateCount(value) {
 }
 
 socket.on("update", receiveUpdate);
+socket.on("updates", receiveUpdates);
+socket.on("users", receiveUsers);
 
 socket.on("join", (data) => {
   try {
     if (data === false) {
       throw Error('Server responded "false" to join');
     }
-    updateCount(data);
+    if (typeof data === "number") {
+      updateCount(data);
+    } else {
+      wire =
+        data.format === "compact"
+          ? { epoch: data.epoch, users: data.users }
+          : null;
+      if (data.reset) {
+        clearRecords();
+        lastSeq = null;
+        seenSeqs.clear();
+      }
+      data.records.forEach(receiveRecord);
+      lastSeq = Math.max(lastSeq ?? 0, data.seq);
+      updateCount(data.total);
+    }
+    joined = true;
+    if (inFlight !== null) {
+      emitInFlight();
+    } else {
+      flushUpdates();
+    }
   } catch (e) {
     console.log(e);
     alert(
@@ -100,10 +212,20 @@ socket.on("join", (data) => {
   }
 });
 
-document.cookie.split(";").some((cookie) => {
-  if (cookie.startsWith("session=")) {
-    let sessionKey = cookie.slice(8);
-    socket.emit("join", sessionKey);
-    return true;
-  }
+socket.on("disconnect", () => {
+  joined = false;
+});
+
+socket.on("connect", () => {
+  document.cookie.split(";").some((cookie) => {
+    if (cookie.trim().startsWith("session=")) {
+      let sessionKey = cookie.trim().slice(8);
+      socket.emit("join", {
+        token: sessionKey,
+        seq: lastSeq,
+        format: "compact",
+      });
+      return true;
+    }
+  });
 });
@@ -0,0 +1,151 @@
+import sqlite3
+from heapq import heapify, heappop, heappush
+from os import environ
+from pickle import dumps, loads
+from threading import Lock
+from time import time
+
+
+class MemoryStore:
+    def __init__(self, max_size: int = None):
+        self._data = {}
+        self._expiry_heap = []
+        self._max_size = max_size
+        self._lock = Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._data:
+                return None
+            value, expiry = self._data[key]
+            if time() > expiry:
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value, expiry: float):
+        with self._lock:
+            self._data[key] = (value, expiry)
+            heappush(self._expiry_heap, (expiry, key))
+            if self._max_size is not None:
+                while len(self._data) > self._max_size:
+                    self._pop_oldest()
+            if len(self._expiry_heap) > 2 * len(self._data) + 1024:
+                self._expiry_heap = [
+                    (expiry, key) for key, (_, expiry) in self._data.items()
+                ]
+                heapify(self._expiry_heap)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clean(self):
+        now = time()
+        with self._lock:
+            while len(self._expiry_heap) > 0 and self._expiry_heap[0][0] < now:
+                expiry, key = heappop(self._expiry_heap)
+                if key in self._data and self._data[key][1] == expiry:
+                    del self._data[key]
+
+    def _pop_oldest(self):
+        while len(self._expiry_heap) > 0:
+            expiry, key = heappop(self._expiry_heap)
+            if key in self._data and self._data[key][1] == expiry:
+                del self._data[key]
+                return
+
+
+class SQLiteStore:
+    def __init__(self, path: str, namespace: str, max_size: int = None):
+        self._namespace = namespace
+        self._max_size = max_size
+        self._sets_since_size_check = 0
+        self._lock = Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS store ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                "value BLOB NOT NULL, expiry REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS _store_expiry ON store (namespace, expiry)"
+            )
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM store WHERE namespace = ?", (self._namespace,)
+            ).fetchone()[0]
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM store WHERE namespace = ? AND key = ? AND expiry >= ?",
+                (self._namespace, key, time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return loads(row[0])
+
+    def set(self, key: str, value, expiry: float):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO store (namespace, key, value, expiry) "
+                "VALUES (?, ?, ?, ?)",
+                (self._namespace, key, dumps(value), expiry),
+            )
+        if self._max_size is None:
+            return
+        self._sets_since_size_check += 1
+        if self._sets_since_size_check >= max(1, self._max_size // 16):
+            self._sets_since_size_check = 0
+            self._enforce_max_size()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM store WHERE namespace = ? AND key = ?",
+                (self._namespace, key),
+            )
+
+    def clean(self):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM store WHERE namespace = ? AND expiry < ?",
+                (self._namespace, time()),
+            )
+
+    def _enforce_max_size(self):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM store WHERE namespace = ? AND expiry <= ("
+                "SELECT expiry FROM store WHERE namespace = ? "
+                "ORDER BY expiry DESC LIMIT 1 OFFSET ?)",
+                (self._namespace, self._namespace, self._max_size),
+            )
+
+
+def create_store(namespace: str, max_size: int = None):
+    backend = environ.get("SESSION_STORE", "memory").lower()
+    if backend == "memory":
+        return MemoryStore(max_size)
+    if backend == "sqlite":
+        return SQLiteStore(
+            environ.get("SESSION_STORE_PATH", "data/sessions.db"), namespace, max_size
+        )
+    raise ValueError(f"Unknown session store {backend}")
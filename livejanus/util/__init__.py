@@ -2,6 +2,8 @@ from datetime import datetime
 from os import environ
 from random import choices
 from string import ascii_letters, digits
+from typing import Iterable, Iterator
+from zlib import compressobj
 
 alphanumeric = digits + ascii_letters
 
@@ -10,6 +12,10 @@ def time_as_utc() -> float:
     return datetime.utcnow().timestamp()
 
 
+def as_microseconds(seconds: float) -> int:
+    return int(round(seconds * 1_000_000))
+
+
 class SocketInvalidDataException(Exception):
     pass
 
@@ -20,3 +26,12 @@ def random_string(source: str = alphanumeric, length: int = 6) -> str:
 
 def is_debug() -> bool:
     return str(environ.get("DEBUG", False)).lower() == "true"
+
+
+def gzip_stream(chunks: Iterable[str]) -> Iterator[bytes]:
+    compressor = compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if len(compressed) > 0:
+            yield compressed
+    yield compressor.flush()